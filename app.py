@@ -5,12 +5,17 @@ import cv2
 import face_recognition
 import numpy as np
 from datetime import datetime, timedelta, time as dt_time
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Float, func
+from sqlalchemy import create_engine, Column, Integer, String, DateTime, Float, LargeBinary, Index, func, literal, or_, select, tuple_, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.orm import sessionmaker
 import json
 import threading
 import time
+import bisect
+import heapq
+import itertools
+import queue
 import traceback
 from functools import wraps
 import io
@@ -20,6 +25,12 @@ from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph,
 from reportlab.lib.styles import getSampleStyleSheet
 from reportlab.lib.units import inch
 import pandas as pd
+from camera_pipeline import FaceQualityGate, FaceTracker, MotionGate, FrameScheduler, FrameGrabber, RecognitionBudget, RegionOfInterest, parse_roi, recognize_tracks
+from face_detectors import DEFAULT_DETECTOR, create_detector
+from face_gallery import GalleryService, HotSet, UnknownCache, MODE_MIN, encodings_to_bytes, encodings_from_bytes, save_snapshot, load_snapshot
+from recognition_workers import RecognitionPool
+from attendance_journal import AttendanceJournal
+from slot_recompute import DAY_NAMES, DEFAULT_CLASS_DAYS, recompute_slot_attendance
 
 app = Flask(__name__, template_folder='templates', static_folder='static')
 app.secret_key = 'your-secret-key-change-in-production-12345'  # Change this in production!
@@ -50,7 +61,8 @@ class User(Base):
     name = Column(String(100), nullable=False)
     usn = Column(String(50), nullable=False, unique=True)  # University Serial Number (unique)
     password = Column(String(255), nullable=True)  # For student login (optional, can use USN)
-    face_encodings = Column(String, nullable=False)  # JSON array of multiple face encodings
+    face_encodings = Column(String, nullable=False, default='')  # Legacy JSON array of face encodings (migrated to face_encoding_blob)
+    face_encoding_blob = Column(LargeBinary, nullable=True)  # Raw float32 bytes, 128 floats per photo
     image_paths = Column(String)  # JSON array of image paths (1-2 photos)
     status = Column(String(20), default='pending')  # pending, approved, rejected
     created_at = Column(DateTime, default=datetime.now)
@@ -71,6 +83,11 @@ class Attendance(Base):
     class_start_time = Column(DateTime, nullable=True)  # For late detection
     date = Column(String(20), nullable=False)  # YYYY-MM-DD for easy querying
     is_archived = Column(Integer, default=0)  # 0 = not archived, 1 = archived
+    
+    # Daily reports and slot recomputes read one date range at a time
+    __table_args__ = (
+        Index('ix_attendance_date', 'date'),
+    )
 
 class ClassSettings(Base):
     __tablename__ = 'class_settings'
@@ -78,6 +95,7 @@ class ClassSettings(Base):
     class_start_time = Column(String(10), nullable=False, default='09:00:00')  # Format: HH:MM:SS
     late_threshold_minutes = Column(Integer, nullable=False, default=10)
     last_updated = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+    absences_through = Column(String(20), nullable=True)  # Last date with Absent rows written (YYYY-MM-DD)
 
 class ClassSlot(Base):
     __tablename__ = 'class_slots'
@@ -103,6 +121,13 @@ class SlotAttendance(Base):
     exit_time = Column(DateTime, nullable=True)  # When student exited during this slot
     overlap_minutes = Column(Float, nullable=True)  # Minutes of overlap with slot
     created_at = Column(DateTime, default=datetime.now)
+    
+    # One row per student, slot and day - lets slot attendance be written as a bulk upsert.
+    # Reports read a whole day at a time, hence the (date, slot_id) index.
+    __table_args__ = (
+        Index('uq_slot_attendance_user_slot_date', 'user_id', 'slot_id', 'date', unique=True),
+        Index('ix_slot_attendance_date_slot', 'date', 'slot_id'),
+    )
 
 # Create tables and handle migrations
 Base.metadata.create_all(engine)
@@ -142,6 +167,27 @@ def migrate_database():
                             conn.commit()
                             print("Migration: Added status column")
                         
+                        # Binary float32 storage for face encodings
+                        if 'face_encoding_blob' not in columns:
+                            conn.execute(text("ALTER TABLE users ADD COLUMN face_encoding_blob BLOB"))
+                            conn.commit()
+                            print("Migration: Added face_encoding_blob column")
+                        
+                        # Convert remaining JSON encodings to float32 bytes
+                        rows = conn.execute(text("""
+                            SELECT id, face_encodings FROM users
+                            WHERE face_encoding_blob IS NULL AND face_encodings IS NOT NULL AND face_encodings != ''
+                        """)).fetchall()
+                        if rows:
+                            for user_id, encodings_json in rows:
+                                encodings_list = json.loads(encodings_json)
+                                conn.execute(
+                                    text("UPDATE users SET face_encoding_blob = :blob, face_encodings = '' WHERE id = :id"),
+                                    {'blob': encodings_to_bytes(encodings_list), 'id': user_id}
+                                )
+                            conn.commit()
+                            print(f"Migration: Converted {len(rows)} users to binary face encodings")
+                        
                         if 'image_paths' not in columns:
                             conn.execute(text("ALTER TABLE users ADD COLUMN image_paths VARCHAR"))
                             # Migrate old image_path to image_paths array
@@ -213,6 +259,13 @@ def migrate_database():
                             conn.commit()
                             print("Migration: Inserted default class settings")
                     
+                    # Absences are backfilled from the first recorded day while this is NULL
+                    result = conn.execute(text("PRAGMA table_info(class_settings)"))
+                    if 'absences_through' not in [row[1] for row in result]:
+                        conn.execute(text("ALTER TABLE class_settings ADD COLUMN absences_through TEXT"))
+                        conn.commit()
+                        print("Migration: Added absences_through column")
+                    
                     # Migrate class_slots table
                     if 'class_slots' not in existing_tables:
                         conn.execute(text("""
@@ -249,6 +302,36 @@ def migrate_database():
                         """))
                         conn.commit()
                         print("Migration: Created slot_attendance table")
+                    
+                    # Unique (user_id, slot_id, date) key for slot attendance upserts
+                    result = conn.execute(text("PRAGMA index_list(slot_attendance)"))
+                    if 'uq_slot_attendance_user_slot_date' not in [row[1] for row in result]:
+                        # Collapse duplicates first, keeping a Present/Late row over Absent, then the newest
+                        removed = conn.execute(text("""
+                            DELETE FROM slot_attendance WHERE id IN (
+                                SELECT id FROM (
+                                    SELECT id, ROW_NUMBER() OVER (
+                                        PARTITION BY user_id, slot_id, date
+                                        ORDER BY CASE WHEN status = 'Absent' THEN 1 ELSE 0 END, id DESC
+                                    ) AS rn
+                                    FROM slot_attendance
+                                ) WHERE rn > 1
+                            )
+                        """)).rowcount
+                        conn.execute(text("""
+                            CREATE UNIQUE INDEX uq_slot_attendance_user_slot_date
+                            ON slot_attendance (user_id, slot_id, date)
+                        """))
+                        conn.commit()
+                        print(f"Migration: Added unique slot attendance key (removed {removed} duplicate rows)")
+                    
+                    conn.execute(text("""
+                        CREATE INDEX IF NOT EXISTS ix_slot_attendance_date_slot
+                        ON slot_attendance (date, slot_id)
+                    """))
+                    if 'attendance' in existing_tables:
+                        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_attendance_date ON attendance (date)"))
+                    conn.commit()
                 except Exception as e:
                     print(f"Migration error: {e}")
                     import traceback
@@ -278,10 +361,28 @@ def migrate_database():
 migrate_database()
 
 # Global variables for face recognition
-known_face_encodings = []  # List of lists (multiple encodings per user)
-known_face_names = []
-known_face_usns = []
-known_face_ids = []
+# User-indexed gallery (encodings grouped per user, ids/names/USNs per user row)
+# FACE_GALLERY_MODE: 'min' keeps every photo, 'centroid' averages each user's photos
+FACE_GALLERY_MODE = os.getenv('FACE_GALLERY_MODE', MODE_MIN)
+
+# Approximate nearest-neighbour index for campus-size galleries (see face_index.py)
+# FACE_INDEX: 'none' = exact scan, 'ivf' = always index, 'auto' = index once the gallery is large
+FACE_INDEX = os.getenv('FACE_INDEX', 'auto')
+FACE_INDEX_MIN_ENCODINGS = int(os.getenv('FACE_INDEX_MIN_ENCODINGS', '20000'))
+FACE_INDEX_NPROBE = int(os.getenv('FACE_INDEX_NPROBE', '8'))  # Recall/latency knob
+
+# Live gallery: camera threads read face_gallery_service.snapshot (immutable, versioned);
+# user changes swap in a new snapshot instead of reloading everything
+face_gallery_service = GalleryService(
+    mode=FACE_GALLERY_MODE,
+    index_kind=FACE_INDEX,
+    index_min_encodings=FACE_INDEX_MIN_ENCODINGS,
+    nprobe=FACE_INDEX_NPROBE
+)
+
+# Persisted gallery (.npy matrix + JSON sidecar), memory-mapped on startup and
+# shared through the page cache by every worker process
+GALLERY_SNAPSHOT_DIR = os.getenv('GALLERY_SNAPSHOT_DIR', 'gallery_snapshot')
 face_recognition_lock = threading.Lock()
 
 # Real-time alerts queue
@@ -289,7 +390,7 @@ alerts_queue = []
 alerts_lock = threading.Lock()
 
 # Class schedule - will be loaded from database
-def get_class_settings():
+def load_class_settings():
     """Get class settings from database"""
     session = Session()
     try:
@@ -308,42 +409,286 @@ def get_class_settings():
     finally:
         session.close()
 
+# Class settings are needed for every new entry, so they are cached in-process.
+# POST /api/class-time invalidates the cache; the TTL picks up changes made by other processes.
+CLASS_SETTINGS_TTL = float(os.getenv('CLASS_SETTINGS_TTL', '60'))
+class_settings_cache = {'settings': None, 'loaded_at': 0.0, 'schedules': {}}
+class_settings_lock = threading.Lock()
+
+def get_class_settings():
+    """Class settings (cached, see CLASS_SETTINGS_TTL)"""
+    with class_settings_lock:
+        if class_settings_cache['settings'] is not None and time.time() - class_settings_cache['loaded_at'] < CLASS_SETTINGS_TTL:
+            return dict(class_settings_cache['settings'])
+    settings = load_class_settings()
+    with class_settings_lock:
+        if settings != class_settings_cache['settings']:
+            class_settings_cache['schedules'] = {}
+        class_settings_cache['settings'] = settings
+        class_settings_cache['loaded_at'] = time.time()
+    return dict(settings)
+
+def invalidate_class_settings():
+    with class_settings_lock:
+        class_settings_cache['settings'] = None
+        class_settings_cache['schedules'] = {}
+
+def get_class_schedule(day):
+    """(class_start, late_limit) datetimes for a date, parsed once per date; (None, None) if unset"""
+    settings = get_class_settings()
+    with class_settings_lock:
+        schedule = class_settings_cache['schedules'].get(day)
+    if schedule is not None:
+        return schedule
+    
+    schedule = (None, None)
+    class_start_str = settings['class_start_time']
+    if class_start_str:
+        # Parse class start time (format: HH:MM:SS or HH:MM)
+        try:
+            time_parts = class_start_str.split(':')
+            hour = int(time_parts[0])
+            minute = int(time_parts[1])
+            second = int(time_parts[2]) if len(time_parts) > 2 else 0
+            class_start = datetime.combine(day, dt_time(hour, minute, second))
+            
+            # Calculate late limit (class start + threshold)
+            schedule = (class_start, class_start + timedelta(minutes=settings['late_threshold_minutes']))
+        except Exception as e:
+            print(f"Error checking late status: {e}")
+    
+    with class_settings_lock:
+        schedules = class_settings_cache['schedules']
+        if len(schedules) > 31:
+            schedules.clear()  # Only a handful of dates are ever live
+        schedules[day] = schedule
+    return schedule
+
 # Active sessions tracking (user_id -> {entry_time, last_seen, camera_id})
 active_sessions = {}
 
+# Exit detection: a student who has not been seen for EXIT_TIMEOUT_SECONDS has left.
+# Exit timers live in a min-heap of (deadline, sequence, user_id, presence) - see check_exits.
+EXIT_TIMEOUT_SECONDS = float(os.getenv('EXIT_TIMEOUT_SECONDS', '30'))
+exit_timers = []
+exit_timers_lock = threading.Lock()
+exit_timers_changed = threading.Event()
+exit_timer_sequence = itertools.count()
+
 # Track active camera threads
 # Track active camera threads and their latest frames
 active_camera_threads = {}
 frame_lock = threading.Lock()
 
-def load_known_faces():
-    """Load all known faces from database (only approved users)"""
-    global known_face_encodings, known_face_names, known_face_usns, known_face_ids
+# Per-camera defaults (overridable in POST /api/cameras)
+# Motion gate: fraction of changed pixels that wakes detection, and forced keyframe interval (frames)
+CAMERA_MOTION_SENSITIVITY = float(os.getenv('CAMERA_MOTION_SENSITIVITY', '0.01'))
+CAMERA_KEYFRAME_INTERVAL = int(os.getenv('CAMERA_KEYFRAME_INTERVAL', '30'))
+# Face detector backend (hog, haar, lbp, two-stage - see face_detectors.py)
+CAMERA_DETECTOR = os.getenv('CAMERA_DETECTOR', DEFAULT_DETECTOR)
+# Quality gate before encoding: smallest face side (detection-frame pixels), Laplacian
+# sharpness and max head turn (nose offset / eye distance); 0 disables a check
+CAMERA_QUALITY_MIN_SIZE = int(os.getenv('CAMERA_QUALITY_MIN_SIZE', '20'))
+CAMERA_QUALITY_MIN_SHARPNESS = float(os.getenv('CAMERA_QUALITY_MIN_SHARPNESS', '20'))
+CAMERA_QUALITY_MAX_YAW = float(os.getenv('CAMERA_QUALITY_MAX_YAW', '0.6'))
+# Downscale factor applied to the frame (or its ROI crop) before detection
+CAMERA_DOWNSCALE = float(os.getenv('CAMERA_DOWNSCALE', '0.25'))
+
+# Hot set: users inside plus the last HOT_SET_CAPACITY recognized within HOT_SET_TTL_MINUTES
+# are matched first; a hot match closer than HOT_SET_CONFIDENT_DISTANCE skips the full scan
+HOT_SET_OPTIONS = {
+    'capacity': int(os.getenv('HOT_SET_CAPACITY', '64')),
+    'ttl': float(os.getenv('HOT_SET_TTL_MINUTES', '30')) * 60,
+    'confident_distance': float(os.getenv('HOT_SET_CONFIDENT_DISTANCE', '0.4'))
+}
+hot_set = HotSet(**HOT_SET_OPTIONS)
+
+# Unknown cache: faces that matched nobody (at least UNKNOWN_CACHE_MIN_DISTANCE from every user)
+# are remembered for UNKNOWN_CACHE_TTL seconds; a probe within UNKNOWN_CACHE_RADIUS of one is
+# Unknown without a gallery scan. Cleared whenever the gallery version changes.
+# UNKNOWN_CACHE_MIN_DISTANCE must be >= 0.5 (the match tolerance) + UNKNOWN_CACHE_RADIUS.
+UNKNOWN_CACHE_OPTIONS = {
+    'capacity': int(os.getenv('UNKNOWN_CACHE_SIZE', '128')),
+    'ttl': float(os.getenv('UNKNOWN_CACHE_TTL', '60')),
+    'radius': float(os.getenv('UNKNOWN_CACHE_RADIUS', '0.3')),
+    'min_gallery_distance': float(os.getenv('UNKNOWN_CACHE_MIN_DISTANCE', '0.8'))
+}
+unknown_cache = UnknownCache(**UNKNOWN_CACHE_OPTIONS)
+
+# Recognition worker processes (0 = recognize inside the camera threads)
+RECOGNITION_WORKERS = int(os.getenv('RECOGNITION_WORKERS', '0'))
+RECOGNITION_MAX_PENDING = int(os.getenv('RECOGNITION_MAX_PENDING', '2'))  # Frames queued per worker before skipping
+
+# Adaptive scheduler: recognitions/second per camera, and the recognition CPU budget
+# (seconds of work per second, 1.0 = one core) shared fairly by all running cameras.
+# With worker processes the time charged is the wait for a worker, and each worker is a
+# core of its own, so the default budget is one core per worker.
+RECOGNITION_TARGET_FPS = float(os.getenv('RECOGNITION_TARGET_FPS', '5'))
+recognition_budget = RecognitionBudget(float(os.getenv('RECOGNITION_CPU_BUDGET', str(max(1, RECOGNITION_WORKERS)))))
+recognition_pool = None
+recognition_pool_lock = threading.Lock()
+
+def get_recognition_pool():
+    """The recognition worker pool, started at import (None when RECOGNITION_WORKERS is 0)"""
+    global recognition_pool
+    if RECOGNITION_WORKERS <= 0:
+        return None
+    with recognition_pool_lock:
+        if recognition_pool is None:
+            recognition_pool = RecognitionPool(
+                RECOGNITION_WORKERS,
+                GALLERY_SNAPSHOT_DIR,
+                {
+                    'mode': FACE_GALLERY_MODE,
+                    'index_kind': FACE_INDEX,
+                    'index_min_encodings': FACE_INDEX_MIN_ENCODINGS,
+                    'nprobe': FACE_INDEX_NPROBE
+                },
+                hot_options=HOT_SET_OPTIONS,
+                unknown_options=UNKNOWN_CACHE_OPTIONS,
+                tolerance=0.5,
+                max_pending=RECOGNITION_MAX_PENDING
+            )
+            print(f"Started {RECOGNITION_WORKERS} recognition worker processes")
+        return recognition_pool
+
+# USNs looked up from the database for gallery rows that had none
+usn_lookup_cache = {}
+
+def build_camera_config(data):
+    """Validate per-camera options from a POST /api/cameras body. Returns (config, error)"""
+    config = {}
+    try:
+        config['motion_sensitivity'] = float(data.get('motion_sensitivity', CAMERA_MOTION_SENSITIVITY))
+        config['keyframe_interval'] = int(data.get('keyframe_interval', CAMERA_KEYFRAME_INTERVAL))
+        config['recognition_fps'] = float(data.get('recognition_fps', RECOGNITION_TARGET_FPS))
+        config['downscale'] = float(data.get('downscale', CAMERA_DOWNSCALE))
+        config['quality'] = {
+            'min_size': int(data.get('quality_min_size', CAMERA_QUALITY_MIN_SIZE)),
+            'min_sharpness': float(data.get('quality_min_sharpness', CAMERA_QUALITY_MIN_SHARPNESS)),
+            'max_yaw': float(data.get('quality_max_yaw', CAMERA_QUALITY_MAX_YAW))
+        }
+    except (TypeError, ValueError):
+        return None, 'motion_sensitivity, recognition_fps, downscale and quality thresholds must be numbers, keyframe_interval and quality_min_size integers'
+    # Optional region of interest in frame pixels: rectangle or polygon
+    try:
+        config['roi'] = parse_roi(data.get('roi'))
+    except ValueError as e:
+        return None, str(e)
+    if not 0 <= config['motion_sensitivity'] <= 1:
+        return None, 'motion_sensitivity must be between 0 and 1'
+    if config['keyframe_interval'] < 1:
+        return None, 'keyframe_interval must be >= 1'
+    if config['recognition_fps'] <= 0:
+        return None, 'recognition_fps must be > 0'
+    if not 0 < config['downscale'] <= 1:
+        return None, 'downscale must be between 0 (exclusive) and 1'
+    if min(config['quality'].values()) < 0:
+        return None, 'quality thresholds must be >= 0 (0 disables a check)'
+    config['detector'] = data.get('detector', CAMERA_DETECTOR)
+    try:
+        create_detector(config['detector'])  # Fails early if the cascade files are missing
+    except ValueError as e:
+        return None, str(e)
+    return config, None
+
+def get_user_encodings(face_encoding_blob, face_encodings_json):
+    """Decode a user's stored encodings (binary column, or legacy JSON if not migrated yet)"""
+    if face_encoding_blob:
+        return encodings_from_bytes(face_encoding_blob)
+    return json.loads(face_encodings_json) if face_encodings_json else []
+
+def get_gallery_fingerprint():
+    """
+    Cheap summary of the approved users, used to detect a stale gallery snapshot.
+    Aggregates only (count, newest id and approval, total name/USN/encoding sizes), so it
+    never reads the encodings themselves; the app rewrites the snapshot on every gallery
+    change, this guards against outside edits.
+    """
+    from sqlalchemy import text
+    with engine.connect() as conn:
+        row = conn.execute(text("""
+            SELECT COUNT(*), MAX(id), MAX(approved_at),
+                   SUM(LENGTH(name) + LENGTH(usn)),
+                   SUM(LENGTH(face_encoding_blob)), SUM(LENGTH(face_encodings))
+            FROM users WHERE status = 'approved'
+        """)).one()
+    return [value if value is None or isinstance(value, (int, str)) else str(value) for value in row]
+
+def save_gallery_snapshot(gallery):
+    """Write the current gallery to disk so the next start (or another worker) can mmap it"""
+    try:
+        save_snapshot(gallery, GALLERY_SNAPSHOT_DIR, get_gallery_fingerprint())
+    except Exception as e:
+        print(f"⚠ Warning: Could not save gallery snapshot: {e}")
+
+# Gallery changes are published in memory at once; the snapshot on disk is rewritten by
+# a background writer, at most once per GALLERY_SNAPSHOT_DELAY seconds (a burst of
+# approvals is one write of the newest version)
+GALLERY_SNAPSHOT_DELAY = float(os.getenv('GALLERY_SNAPSHOT_DELAY', '1.0'))
+gallery_snapshot_pending = threading.Event()
+
+def gallery_snapshot_thread():
+    while True:
+        gallery_snapshot_pending.wait()
+        time.sleep(GALLERY_SNAPSHOT_DELAY)
+        gallery_snapshot_pending.clear()
+        save_gallery_snapshot(face_gallery_service.snapshot)
+
+def load_known_faces(use_snapshot=True):
+    """Load all known faces (only approved users) from the on-disk snapshot, or the database if it is stale"""
+    if use_snapshot:
+        try:
+            gallery, centroids = load_snapshot(GALLERY_SNAPSHOT_DIR, get_gallery_fingerprint(), FACE_GALLERY_MODE)
+        except Exception as e:
+            print(f"⚠ Warning: Could not open gallery snapshot: {e}")
+            gallery, centroids = None, None
+        if gallery is not None:
+            gallery = face_gallery_service.load_gallery(gallery, centroids)
+            print(f"Loaded {len(gallery)} approved users with {gallery.num_encodings} total face encodings from snapshot (gallery v{gallery.version})")
+            return
+        print("Gallery snapshot missing or stale - loading from database")
+    
     session = Session()
     try:
-        # Only load approved users
-        users = session.query(User).filter(User.status == 'approved').all()
-        known_face_encodings = []
-        known_face_names = []
-        known_face_usns = []
-        known_face_ids = []
-        
-        total_encodings = 0
+        # Only load approved users (just the columns the gallery needs)
+        users = session.query(
+            User.id, User.name, User.usn, User.face_encoding_blob, User.face_encodings
+        ).filter(User.status == 'approved').all()
+        
+        gallery_users = []
         for user in users:
             # Load multiple face encodings per user
-            encodings_list = json.loads(user.face_encodings) if user.face_encodings else []
-            
-            # Add each encoding with user info
-            for encoding in encodings_list:
-                known_face_encodings.append(np.array(encoding))
-                known_face_names.append(user.name)
-                known_face_usns.append(user.usn)
-                known_face_ids.append(user.id)
-                total_encodings += 1
+            encodings_list = get_user_encodings(user.face_encoding_blob, user.face_encodings)
+            gallery_users.append((user.id, user.name, user.usn, encodings_list))
+        
+        # Build the user-indexed matrix used by the camera threads
+        gallery = face_gallery_service.load(gallery_users)
+        if gallery.index is not None:
+            print(f"Built IVF face index: {gallery.index.nlist} lists, nprobe={gallery.index.nprobe}")
         
-        print(f"Loaded {len(users)} approved users with {total_encodings} total face encodings")
+        print(f"Loaded {len(users)} approved users with {gallery.num_encodings} total face encodings (gallery v{gallery.version})")
     finally:
         session.close()
+    
+    save_gallery_snapshot(gallery)
+
+def update_known_face(user):
+    """Add, replace or remove a single user's encodings in the live gallery"""
+    usn_lookup_cache.pop(user.id, None)
+    if user.status == 'approved':
+        encodings_list = get_user_encodings(user.face_encoding_blob, user.face_encodings)
+        gallery = face_gallery_service.upsert_user(user.id, user.name, user.usn, encodings_list)
+    else:
+        gallery = face_gallery_service.remove_user(user.id)
+    print(f"Gallery updated for {user.name} (ID: {user.id}) -> v{gallery.version}, {gallery.num_encodings} encodings")
+    gallery_snapshot_pending.set()
+
+def remove_known_face(user_id):
+    """Drop a deleted user from the live gallery"""
+    usn_lookup_cache.pop(user_id, None)
+    face_gallery_service.remove_user(user_id)
+    gallery_snapshot_pending.set()
 
 def add_alert(alert_type, message, user_name=None, user_usn=None, timestamp=None):
     """Add alert to queue for real-time notifications"""
@@ -362,33 +707,13 @@ def add_alert(alert_type, message, user_name=None, user_usn=None, timestamp=None
             alerts_queue.pop(0)
 
 def check_if_late(entry_time):
-    """Check if entry is late based on class start time from database"""
-    settings = get_class_settings()
-    class_start_str = settings['class_start_time']
-    late_threshold = settings['late_threshold_minutes']
-    
-    if not class_start_str:
+    """Check if entry is late based on the (cached) class start time"""
+    class_start, late_limit = get_class_schedule(entry_time.date())
+    if class_start is None:
         return False
     
-    # Parse class start time (format: HH:MM:SS or HH:MM)
-    try:
-        time_parts = class_start_str.split(':')
-        hour = int(time_parts[0])
-        minute = int(time_parts[1])
-        second = int(time_parts[2]) if len(time_parts) > 2 else 0
-        
-        # Get today's date
-        today = entry_time.date()
-        class_start = datetime.combine(today, dt_time(hour, minute, second))
-        
-        # Calculate late limit (class start + threshold)
-        late_limit = class_start + timedelta(minutes=late_threshold)
-        
-        # Check if entry is after late limit
-        return entry_time > late_limit
-    except Exception as e:
-        print(f"Error checking late status: {e}")
-        return False
+    # Check if entry is after late limit
+    return entry_time > late_limit
 
 def get_class_slots_for_date(date_str=None):
     """Get all class slots for a given date (or today if not specified)"""
@@ -411,439 +736,678 @@ def get_class_slots_for_date(date_str=None):
     finally:
         session.close()
 
-def calculate_slot_overlap(entry_time, exit_time, slot_start_str, slot_end_str, date_str):
-    """Calculate overlap in minutes between entry/exit times and a slot"""
+# Compiled slot schedules per date, so entries and exits never query ClassSlot or re-parse
+# "HH:MM" strings. The class-slots handlers invalidate it; the TTL covers other processes.
+SLOT_SCHEDULE_TTL = float(os.getenv('SLOT_SCHEDULE_TTL', '60'))
+slot_schedule_cache = {}
+slot_schedule_lock = threading.Lock()
+# Set when slots change, so the absence scheduler re-plans its next wake-up
+slot_schedule_changed = threading.Event()
+
+# Days classes are held: slots without a day_of_week only mark absences on these days
+CLASS_DAYS = [day.strip() for day in os.getenv('CLASS_DAYS', ','.join(DEFAULT_CLASS_DAYS)).split(',') if day.strip()]
+
+def compile_slot_schedule(date_str):
+    """
+    One date's slots as plain dicts with start/end datetimes, sorted by start, plus
+    the sorted starts and the running max of the ends for bisect lookups
+    """
+    date_obj = datetime.strptime(date_str, '%Y-%m-%d').date()
+    slots = []
+    for slot in get_class_slots_for_date(date_str):
+        try:
+            start_hour, start_min = [int(part) for part in slot.start_time.split(':')[:2]]
+            end_hour, end_min = [int(part) for part in slot.end_time.split(':')[:2]]
+        except (AttributeError, ValueError):
+            print(f"⚠ Warning: Skipping class slot {slot.id} with invalid times {slot.start_time}-{slot.end_time}")
+            continue
+        slots.append({
+            'id': slot.id,
+            'class_name': slot.class_name,
+            'start': datetime.combine(date_obj, dt_time(start_hour, start_min)),
+            'end': datetime.combine(date_obj, dt_time(end_hour, end_min)),
+            'day_of_week': slot.day_of_week
+        })
+    slots.sort(key=lambda slot: slot['start'])
+    
+    max_ends = []
+    for slot in slots:
+        max_ends.append(max(slot['end'], max_ends[-1]) if max_ends else slot['end'])
+    return {
+        'slots': slots,
+        'starts': [slot['start'] for slot in slots],
+        'max_ends': max_ends,
+        'loaded_at': time.time()
+    }
+
+def get_slot_schedule(date_str):
+    """Compiled schedule for a date (cached, see SLOT_SCHEDULE_TTL)"""
+    with slot_schedule_lock:
+        schedule = slot_schedule_cache.get(date_str)
+        if schedule is not None and time.time() - schedule['loaded_at'] < SLOT_SCHEDULE_TTL:
+            return schedule
+    schedule = compile_slot_schedule(date_str)
+    with slot_schedule_lock:
+        if len(slot_schedule_cache) > 31:
+            slot_schedule_cache.clear()  # Only a handful of dates are ever live
+        slot_schedule_cache[date_str] = schedule
+    return schedule
+
+def invalidate_slot_schedules():
+    with slot_schedule_lock:
+        slot_schedule_cache.clear()
+    slot_schedule_changed.set()
+
+def overlapping_slot_indexes(schedule, start_time, end_time):
+    """Indexes of the slots that intersect [start_time, end_time), found by bisection"""
+    # Slots starting at or after end_time cannot overlap
+    hi = bisect.bisect_left(schedule['starts'], end_time)
+    # Every slot before lo ends at or before start_time
+    lo = bisect.bisect_right(schedule['max_ends'], start_time, 0, hi)
+    return [i for i in range(lo, hi) if schedule['slots'][i]['end'] > start_time]
+
+def process_slot_attendance(user_id, user_name, user_usn, entry_time, exit_time, date_str, session=None, as_of=None):
+    """
+    Process attendance for all slots based on entry/exit times.
+    With a session, the changes join the caller's transaction (the caller commits).
+    as_of is the moment the event happened (default now): an open interval runs until
+    then, so an event applied late from the journal does not count time nobody saw.
+    """
+    own_session = session is None
+    if own_session:
+        session = Session()
     try:
-        # Parse slot times
-        slot_start_parts = slot_start_str.split(':')
-        slot_end_parts = slot_end_str.split(':')
-        slot_start_hour = int(slot_start_parts[0])
-        slot_start_min = int(slot_start_parts[1])
-        slot_end_hour = int(slot_end_parts[0])
-        slot_end_min = int(slot_end_parts[1])
-        
-        # Create datetime objects for slot
-        date_obj = datetime.strptime(date_str, '%Y-%m-%d').date()
-        slot_start = datetime.combine(date_obj, dt_time(slot_start_hour, slot_start_min))
-        slot_end = datetime.combine(date_obj, dt_time(slot_end_hour, slot_end_min))
-        
-        # If exit_time is None, use current time
-        if exit_time is None:
-            exit_time = datetime.now()
-        
-        # Calculate overlap
-        overlap_start = max(entry_time, slot_start)
-        overlap_end = min(exit_time, slot_end)
-        
-        if overlap_start < overlap_end:
-            overlap_minutes = (overlap_end - overlap_start).total_seconds() / 60
-            return overlap_minutes, overlap_start, overlap_end
-        else:
-            return 0, None, None
+        schedule = get_slot_schedule(date_str)
+        created_at = datetime.now()
+        current_time = as_of or created_at
+        # Every-day slots (no day_of_week) only count as missed on class days
+        class_day = DAY_NAMES[datetime.strptime(date_str, '%Y-%m-%d').weekday()] in CLASS_DAYS
+        
+        # If exit_time is None, the student is still inside
+        effective_exit = exit_time if exit_time is not None else current_time
+        overlapping = set(overlapping_slot_indexes(schedule, entry_time, effective_exit))
+        
+        rows = []
+        for index, slot in enumerate(schedule['slots']):
+            overlap_minutes = 0
+            if index in overlapping:
+                overlap_start = max(entry_time, slot['start'])
+                overlap_end = min(effective_exit, slot['end'])
+                overlap_minutes = (overlap_end - overlap_start).total_seconds() / 60
+            
+            # If overlap is at least 1 minute, mark as present (entry after slot start = late)
+            if overlap_minutes >= 1:
+                status = 'Late' if entry_time > slot['start'] else 'Present'
+                rows.append({
+                    'user_id': user_id,
+                    'user_name': user_name,
+                    'user_usn': user_usn,
+                    'slot_id': slot['id'],
+                    'slot_name': slot['class_name'],
+                    'date': date_str,
+                    'status': status,
+                    'entry_time': overlap_start,
+                    'exit_time': overlap_end,
+                    'overlap_minutes': overlap_minutes,
+                    'created_at': created_at
+                })
+            elif current_time > slot['end'] and (slot['day_of_week'] is not None or class_day):
+                # No overlap - the slot has ended, so absent unless a record already exists
+                rows.append({
+                    'user_id': user_id,
+                    'user_name': user_name,
+                    'user_usn': user_usn,
+                    'slot_id': slot['id'],
+                    'slot_name': slot['class_name'],
+                    'date': date_str,
+                    'status': 'Absent',
+                    'entry_time': None,
+                    'exit_time': None,
+                    'overlap_minutes': 0,
+                    'created_at': created_at
+                })
+        
+        if rows:
+            # All of the user's slots in one statement: Present/Late rows overwrite what is
+            # there, Absent rows are only inserted when the student has no record yet
+            stmt = sqlite_insert(SlotAttendance).values(rows)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['user_id', 'slot_id', 'date'],
+                set_={
+                    'status': stmt.excluded.status,
+                    'entry_time': stmt.excluded.entry_time,
+                    'exit_time': stmt.excluded.exit_time,
+                    'overlap_minutes': stmt.excluded.overlap_minutes
+                },
+                where=stmt.excluded.status != 'Absent'
+            )
+            session.execute(stmt)
+        
+        if own_session:
+            session.commit()
     except Exception as e:
-        print(f"Error calculating slot overlap: {e}")
-        return 0, None, None
+        if not own_session:
+            raise
+        session.rollback()
+        print(f"Error processing slot attendance: {e}")
+        import traceback
+        traceback.print_exc()
+    finally:
+        if own_session:
+            session.close()
 
-def process_slot_attendance(user_id, user_name, user_usn, entry_time, exit_time, date_str):
-    """Process attendance for all slots based on entry/exit times"""
+def materialize_absences(date_str, slot_ids=None, exclude_user_ids=()):
+    """
+    Mark every approved student without a record as Absent in the date's ended slots
+    (only slot_ids, if given). Students enrolled after the date are left out, and so are
+    slots without a day_of_week on days that are not CLASS_DAYS. One INSERT ... SELECT
+    per slot; existing rows are left alone through the unique key. Returns the number
+    of rows inserted.
+    """
+    schedule = get_slot_schedule(date_str)
+    current_time = datetime.now()
+    class_day = DAY_NAMES[datetime.strptime(date_str, '%Y-%m-%d').weekday()] in CLASS_DAYS
+    slots = [slot for slot in schedule['slots']
+             if slot['end'] <= current_time and (slot_ids is None or slot['id'] in slot_ids)
+             and (slot['day_of_week'] is not None or class_day)]
+    if not slots:
+        return 0
+    
+    columns = ['user_id', 'user_name', 'user_usn', 'slot_id', 'slot_name', 'date', 'status', 'overlap_minutes', 'created_at']
+    enrolled_on = func.date(func.coalesce(User.approved_at, User.created_at))
     session = Session()
     try:
-        slots = get_class_slots_for_date(date_str)
-        
+        inserted = 0
         for slot in slots:
-            overlap_minutes, overlap_start, overlap_end = calculate_slot_overlap(
-                entry_time, exit_time, slot.start_time, slot.end_time, date_str
-            )
-            
-            # If overlap is at least 1 minute, mark as present
-            if overlap_minutes >= 1:
-                # Check if entry is after slot start (late)
-                slot_start_parts = slot.start_time.split(':')
-                slot_start_hour = int(slot_start_parts[0])
-                slot_start_min = int(slot_start_parts[1])
-                date_obj = datetime.strptime(date_str, '%Y-%m-%d').date()
-                slot_start_dt = datetime.combine(date_obj, dt_time(slot_start_hour, slot_start_min))
+            students = select(
+                User.id, User.name, User.usn,
+                literal(slot['id']), literal(slot['class_name']), literal(date_str), literal('Absent'),
+                literal(0.0), literal(current_time, DateTime)
+            ).where(User.status == 'approved', or_(enrolled_on.is_(None), enrolled_on <= date_str))
+            if exclude_user_ids:
+                students = students.where(User.id.notin_(list(exclude_user_ids)))
+            stmt = sqlite_insert(SlotAttendance).from_select(columns, students)
+            stmt = stmt.on_conflict_do_nothing(index_elements=['user_id', 'slot_id', 'date'])
+            inserted += session.execute(stmt).rowcount
+        session.commit()
+        return inserted
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+def catch_up_absences(through_date):
+    """
+    Materialize absences for every date after class_settings.absences_through up to
+    through_date ('YYYY-MM-DD'), then move the marker. With no marker yet (new install or
+    upgrade) it starts from the first recorded day. Returns the number of rows inserted.
+    """
+    session = Session()
+    try:
+        settings = session.query(ClassSettings).first()
+        if settings is None:
+            return 0
+        if settings.absences_through:
+            start = datetime.strptime(settings.absences_through, '%Y-%m-%d') + timedelta(days=1)
+        else:
+            first_dates = [
+                session.query(func.min(Attendance.date)).scalar(),
+                session.query(func.min(SlotAttendance.date)).scalar()
+            ]
+            first_dates = [date_str for date_str in first_dates if date_str]
+            start = datetime.strptime(min(first_dates) if first_dates else through_date, '%Y-%m-%d')
+        end = datetime.strptime(through_date, '%Y-%m-%d')
+        if start > end:
+            return 0
+        
+        inserted = 0
+        day = start
+        while day <= end:
+            inserted += materialize_absences(day.strftime('%Y-%m-%d'))
+            day += timedelta(days=1)
+        # Keep last_updated: it records admin changes to the class time, not this job
+        session.query(ClassSettings).filter(ClassSettings.id == settings.id).update({
+            ClassSettings.absences_through: through_date,
+            ClassSettings.last_updated: ClassSettings.last_updated
+        })
+        session.commit()
+        print(f"✓ Marked {inserted} absences for {(end - start).days + 1} past date(s) ({start.strftime('%Y-%m-%d')} to {through_date})")
+        return inserted
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+def apply_attendance_events(events):
+    """
+    Journal writer: apply a batch of entry/exit events in one transaction.
+    Idempotent, because events are replayed from the journal log after a crash.
+    """
+    session = Session()
+    alerts = []
+    try:
+        # Every attendance row the batch refers to, in one query: (user_id, entry_time) -> [id, exit_time]
+        # (rows created by entries in this batch are added as their Attendance objects)
+        known_rows = {}
+        keys = list({(event['user_id'], event['entry_time']) for event in events})
+        if keys:
+            rows = session.query(Attendance.id, Attendance.user_id, Attendance.entry_time, Attendance.exit_time).filter(
+                Attendance.date.in_(list({event['date'] for event in events})),
+                tuple_(Attendance.user_id, Attendance.entry_time).in_(keys)
+            ).all()
+            for row_id, user_id, entry_time, exit_time in rows:
+                known_rows[(user_id, entry_time)] = [row_id, exit_time]
+        # Exits of existing rows, written together as one executemany UPDATE
+        closed_rows = []
+        
+        for event in events:
+            user_id = event['user_id']
+            user_name = event['user_name']
+            user_usn = event['user_usn']
+            entry_time = event['entry_time']
+            today_str = event['date']
+            
+            if event['type'] == 'entry':
+                if (user_id, entry_time) in known_rows:
+                    continue  # Already recorded (replayed event)
                 
-                # Check if already exists
-                existing = session.query(SlotAttendance).filter(
-                    SlotAttendance.user_id == user_id,
-                    SlotAttendance.slot_id == slot.id,
-                    SlotAttendance.date == date_str
-                ).first()
+                is_late = check_if_late(entry_time)
+                attendance = Attendance(
+                    user_id=user_id,
+                    user_name=user_name,
+                    user_usn=user_usn,
+                    entry_time=entry_time,
+                    camera_id=event['camera_id'],
+                    date=today_str,
+                    is_late=1 if is_late else 0,
+                    class_start_time=get_class_schedule(entry_time.date())[0]
+                )
+                session.add(attendance)
+                known_rows[(user_id, entry_time)] = attendance
                 
-                if existing:
-                    # Update existing record
-                    existing.status = 'Late' if entry_time > slot_start_dt else 'Present'
-                    existing.entry_time = overlap_start if overlap_start else entry_time
-                    existing.exit_time = overlap_end if overlap_end else exit_time
-                    existing.overlap_minutes = overlap_minutes
+                # Process slot-based attendance (with None exit_time for now)
+                process_slot_attendance(user_id, user_name, user_usn, entry_time, None, today_str, session,
+                                        as_of=entry_time)
+                
+                # Add alert
+                if is_late:
+                    alerts.append(('late', f"{user_name} ({user_usn}) entered late", user_name, user_usn, entry_time))
                 else:
-                    # Create new record
-                    status = 'Late' if entry_time > slot_start_dt else 'Present'
-                    slot_attendance = SlotAttendance(
-                        user_id=user_id,
-                        user_name=user_name,
-                        user_usn=user_usn,
-                        slot_id=slot.id,
-                        slot_name=slot.class_name,
-                        date=date_str,
-                        status=status,
-                        entry_time=overlap_start if overlap_start else entry_time,
-                        exit_time=overlap_end if overlap_end else exit_time,
-                        overlap_minutes=overlap_minutes
-                    )
-                    session.add(slot_attendance)
+                    alerts.append(('entry', f"{user_name} ({user_usn}) entered", user_name, user_usn, entry_time))
+                
+                print(f"✓ Entry recorded: {user_name} (USN: {user_usn}) at {entry_time.strftime('%Y-%m-%d %H:%M:%S')} {'[LATE]' if is_late else ''}")
             else:
-                # No overlap - check if we need to mark as absent
-                # Only mark absent if slot has already started and ended
-                slot_start_parts = slot.start_time.split(':')
-                slot_end_parts = slot.end_time.split(':')
-                slot_start_hour = int(slot_start_parts[0])
-                slot_start_min = int(slot_start_parts[1])
-                slot_end_hour = int(slot_end_parts[0])
-                slot_end_min = int(slot_end_parts[1])
+                exit_time = event['exit_time']
                 
-                date_obj = datetime.strptime(date_str, '%Y-%m-%d').date()
-                slot_start_dt = datetime.combine(date_obj, dt_time(slot_start_hour, slot_start_min))
-                slot_end_dt = datetime.combine(date_obj, dt_time(slot_end_hour, slot_end_min))
+                # Find the attendance record
+                attendance = known_rows.get((user_id, entry_time))
+                if attendance is None:
+                    print(f"⚠ Warning: Could not find attendance record for user_id {user_id} with entry_time {entry_time}")
+                    continue
                 
-                # Only mark absent if slot has ended and no attendance record exists
-                current_time = datetime.now()
-                if current_time > slot_end_dt:
-                    existing = session.query(SlotAttendance).filter(
-                        SlotAttendance.user_id == user_id,
-                        SlotAttendance.slot_id == slot.id,
-                        SlotAttendance.date == date_str
-                    ).first()
-                    
-                    if not existing:
-                        slot_attendance = SlotAttendance(
-                            user_id=user_id,
-                            user_name=user_name,
-                            user_usn=user_usn,
-                            slot_id=slot.id,
-                            slot_name=slot.class_name,
-                            date=date_str,
-                            status='Absent',
-                            entry_time=None,
-                            exit_time=None,
-                            overlap_minutes=0
-                        )
-                        session.add(slot_attendance)
+                duration = (exit_time - entry_time).total_seconds() / 60
+                if isinstance(attendance, Attendance):
+                    # Entered in this same batch
+                    if attendance.exit_time is not None:
+                        continue
+                    attendance.exit_time = exit_time
+                    attendance.duration_minutes = round(duration, 2)
+                else:
+                    if attendance[1] is not None:
+                        continue  # Already closed (replayed event)
+                    attendance[1] = exit_time
+                    closed_rows.append({'id': attendance[0], 'exit_time': exit_time, 'duration_minutes': round(duration, 2)})
+                
+                # Process slot-based attendance with exit time
+                process_slot_attendance(user_id, user_name, user_usn, entry_time, exit_time, today_str, session)
+                
+                if event.get('alert'):
+                    alerts.append(('exit', f"{user_name} ({user_usn}) exited", user_name, user_usn, exit_time))
+                
+                print(f"✓ Exit recorded: {user_name} - Duration: {duration:.2f} minutes")
         
+        if closed_rows:
+            session.execute(update(Attendance), closed_rows)
         session.commit()
-    except Exception as e:
+    except Exception:
         session.rollback()
-        print(f"Error processing slot attendance: {e}")
-        import traceback
-        traceback.print_exc()
+        raise
+    finally:
+        session.close()
+    
+    # Alerts only once the rows are committed
+    for alert in alerts:
+        add_alert(*alert)
+
+# Entry/exit events are journaled and written to the database in batches by one writer thread
+ATTENDANCE_JOURNAL_PATH = os.getenv('ATTENDANCE_JOURNAL_PATH', 'attendance_journal.log')
+attendance_journal = AttendanceJournal(
+    ATTENDANCE_JOURNAL_PATH,
+    apply_attendance_events,
+    interval=float(os.getenv('ATTENDANCE_FLUSH_INTERVAL', '0.25')),
+    datetime_fields=('entry_time', 'exit_time')
+)
+
+# Today's attendance records without an exit, (user_id, date) -> entry_time, so a student
+# seen again after a restart resumes their session without a database lookup
+open_attendance = {}
+
+def load_open_attendance():
+    """Fill open_attendance from the database (startup, after the journal replay)"""
+    today_str = datetime.now().strftime('%Y-%m-%d')
+    session = Session()
+    try:
+        rows = session.query(Attendance.user_id, Attendance.entry_time).filter(
+            Attendance.date == today_str,
+            Attendance.exit_time == None
+        ).order_by(Attendance.entry_time).all()
+        for user_id, entry_time in rows:
+            open_attendance[(user_id, today_str)] = entry_time
     finally:
         session.close()
 
 def process_attendance(user_id, user_name, user_usn, camera_id, is_entry=True):
-    """Process attendance entry/exit for single door system"""
+    """
+    Process attendance entry/exit for single door system.
+    Only updates the in-memory state and journals the event; the database write
+    happens in the attendance journal's writer thread.
+    """
     current_time = datetime.now()
+    
+    # Hot path: already inside - just update last seen, without the lock.
+    # A dict lookup and an item assignment are each atomic, so camera threads never wait
+    # on check_exits here; only real entries and exits take the slow path below.
+    # check_exits pops a session before its final last_seen check, so if the session is
+    # still live after our write, the sighting is seen there; otherwise it is a new entry.
+    if is_entry:
+        presence = active_sessions.get(user_id)
+        if presence is not None:
+            presence['last_seen'] = current_time
+            if active_sessions.get(user_id) is presence:
+                return
+    
     today_str = current_time.strftime('%Y-%m-%d')
     
     with face_recognition_lock:
-        session = Session()
-        try:
-            if is_entry:
-                # Entry detection
-                if user_id in active_sessions:
-                    # Already inside - just update last seen
-                    active_sessions[user_id]['last_seen'] = current_time
-                else:
-                    # New entry
-                    # Check if there's an incomplete session today
-                    existing_entry = session.query(Attendance).filter(
-                        Attendance.user_id == user_id,
-                        Attendance.date == today_str,
-                        Attendance.exit_time == None
-                    ).first()
-                    
-                    if existing_entry:
-                        # Resume existing session
-                        active_sessions[user_id] = {
-                            'entry_time': existing_entry.entry_time,
-                            'last_seen': current_time,
-                            'camera_id': camera_id,
-                            'user_name': user_name,
-                            'user_usn': user_usn
-                        }
-                    else:
-                        # Brand new entry
-                        is_late = check_if_late(current_time)
-                        settings = get_class_settings()
-                        class_start_str = settings['class_start_time']
-                        
-                        # Store class start time as datetime for this record
-                        class_start_dt = None
-                        if class_start_str:
-                            try:
-                                time_parts = class_start_str.split(':')
-                                hour = int(time_parts[0])
-                                minute = int(time_parts[1])
-                                second = int(time_parts[2]) if len(time_parts) > 2 else 0
-                                today = current_time.date()
-                                class_start_dt = datetime.combine(today, dt_time(hour, minute, second))
-                            except:
-                                pass
-                        
-                        active_sessions[user_id] = {
-                            'entry_time': current_time,
-                            'last_seen': current_time,
-                            'camera_id': camera_id,
-                            'user_name': user_name,
-                            'user_usn': user_usn
-                        }
-                        
-                        attendance = Attendance(
-                            user_id=user_id,
-                            user_name=user_name,
-                            user_usn=user_usn,
-                            entry_time=current_time,
-                            camera_id=camera_id,
-                            date=today_str,
-                            is_late=1 if is_late else 0,
-                            class_start_time=class_start_dt
-                        )
-                        session.add(attendance)
-                        session.commit()
-                        
-                        # Process slot-based attendance (with None exit_time for now)
-                        process_slot_attendance(user_id, user_name, user_usn, current_time, None, today_str)
-                        
-                        # Add alert
-                        if is_late:
-                            message = f"{user_name} ({user_usn}) entered late"
-                            add_alert('late', message, user_name, user_usn, current_time)
-                        else:
-                            message = f"{user_name} ({user_usn}) entered"
-                            add_alert('entry', message, user_name, user_usn, current_time)
-                        
-                        print(f"✓ Entry recorded: {user_name} (USN: {user_usn}) at {current_time.strftime('%Y-%m-%d %H:%M:%S')} {'[LATE]' if is_late else ''}")
-            else:
-                # Exit detection
-                if user_id in active_sessions:
-                    entry_time = active_sessions[user_id]['entry_time']
-                    
-                    # Find the attendance record
-                    attendance = session.query(Attendance).filter(
-                        Attendance.user_id == user_id,
-                        Attendance.entry_time == entry_time,
-                        Attendance.exit_time == None,
-                        Attendance.date == today_str
-                    ).first()
-                    
-                    if attendance:
-                        exit_time = current_time
-                        duration = (exit_time - entry_time).total_seconds() / 60
-                        
-                        attendance.exit_time = exit_time
-                        attendance.duration_minutes = round(duration, 2)
-                        session.commit()
-                        
-                        # Process slot-based attendance with exit time
-                        process_slot_attendance(user_id, user_name, user_usn, entry_time, exit_time, today_str)
-                        
-                        # Add exit alert
-                        message = f"{user_name} ({user_usn}) exited"
-                        add_alert('exit', message, user_name, user_usn, exit_time)
-                        
-                        print(f"✓ Exit recorded: {user_name} - Duration: {duration:.2f} minutes")
-                    
-                    # Remove from active sessions
-                    del active_sessions[user_id]
-        except Exception as e:
-            session.rollback()
-            print(f"✗ ERROR processing attendance for {user_name}: {e}")
-            import traceback
-            traceback.print_exc()
-        finally:
-            session.close()
+        if is_entry:
+            # Entry detection
+            if user_id in active_sessions:
+                # Another camera recorded the entry while we waited for the lock
+                active_sessions[user_id]['last_seen'] = current_time
+                return
+            
+            # Resume an incomplete session from earlier today, otherwise record a new entry
+            entry_time = open_attendance.get((user_id, today_str))
+            active_sessions[user_id] = {
+                'entry_time': entry_time or current_time,
+                'last_seen': current_time,
+                'camera_id': camera_id,
+                'user_name': user_name,
+                'user_usn': user_usn
+            }
+            arm_exit_timer(user_id, active_sessions[user_id])
+            if entry_time is None:
+                open_attendance[(user_id, today_str)] = current_time
+                attendance_journal.emit({
+                    'type': 'entry',
+                    'user_id': user_id,
+                    'user_name': user_name,
+                    'user_usn': user_usn,
+                    'camera_id': camera_id,
+                    'date': today_str,
+                    'entry_time': current_time
+                })
+        else:
+            # Exit detection
+            session_data = active_sessions.pop(user_id, None)
+            if session_data is not None:
+                record_exit(user_id, session_data, current_time, today_str, alert=True)
+
+def record_exit(user_id, session_data, exit_time, today_str, alert=False):
+    """Close a session in memory and journal the exit (caller holds face_recognition_lock)"""
+    open_attendance.pop((user_id, today_str), None)
+    attendance_journal.emit({
+        'type': 'exit',
+        'user_id': user_id,
+        'user_name': session_data.get('user_name', 'Unknown'),
+        'user_usn': session_data.get('user_usn', 'N/A'),
+        'date': today_str,
+        'entry_time': session_data['entry_time'],
+        'exit_time': exit_time,
+        'alert': alert
+    })
+
+def arm_exit_timer(user_id, presence):
+    """Schedule the exit check for a presence entry at last_seen + EXIT_TIMEOUT_SECONDS"""
+    deadline = presence['last_seen'] + timedelta(seconds=EXIT_TIMEOUT_SECONDS)
+    with exit_timers_lock:
+        heapq.heappush(exit_timers, (deadline, next(exit_timer_sequence), user_id, presence))
+    exit_timers_changed.set()
 
 def check_exits():
-    """Check for users who haven't been seen recently and mark them as exited"""
-    global active_sessions
+    """
+    Mark users whose exit timer has run out as exited.
+    Timers are re-armed lazily: cameras only move last_seen, and a timer that comes due for
+    someone seen since is pushed back to their new deadline. A call costs O(timers due),
+    whatever the number of people inside.
+    """
+    current_time = datetime.now()
+    due = []
+    with exit_timers_lock:
+        while exit_timers and exit_timers[0][0] <= current_time:
+            due.append(heapq.heappop(exit_timers))
+    if not due:
+        return
+    
+    today_str = current_time.strftime('%Y-%m-%d')
     with face_recognition_lock:
-        if not active_sessions:
-            return
+        for _, _, user_id, presence in due:
+            if active_sessions.get(user_id) is not presence:
+                continue  # Already exited (or exited and came back, with a timer of its own)
+            if presence['last_seen'] + timedelta(seconds=EXIT_TIMEOUT_SECONDS) > current_time:
+                arm_exit_timer(user_id, presence)
+                continue
+            # Leave the presence table first, so the next sighting takes the slow path,
+            # then re-check: a camera may have moved last_seen after the check above
+            active_sessions.pop(user_id, None)
+            if presence['last_seen'] + timedelta(seconds=EXIT_TIMEOUT_SECONDS) > current_time:
+                active_sessions[user_id] = presence
+                arm_exit_timer(user_id, presence)
+                continue
+            record_exit(user_id, presence, presence['last_seen'], today_str)
+
+def next_exit_deadline():
+    """Seconds until the earliest exit timer, or None when nobody is inside"""
+    with exit_timers_lock:
+        if not exit_timers:
+            return None
+        return max(0.0, (exit_timers[0][0] - datetime.now()).total_seconds())
+
+def recognize_frame(camera_id, rgb_small_frame, tracker, frame_count, timings=None, pool=None, detector=None,
+                    quality_gate=None, quality_stats=None):
+    """
+    Detect faces, encode only the tracks that need it, match them and record attendance.
+    Runs in the camera's worker process when a pool is given, otherwise in this thread.
+    Returns (face_locations, face_names) for the overlay, or None if the worker skipped the
+    frame; per-stage seconds go into timings and quality gate outcomes are counted in
+    quality_stats. Faces the gate rejected before they were ever identified get the name
+    None (drawn without an "Unknown" label).
+    """
+    if timings is None:
+        timings = {}
+    
+    # One consistent snapshot for the whole frame
+    gallery = face_gallery_service.snapshot
+    
+    # Everyone currently inside stays hot regardless of when they were last recognized
+    hot_set.set_pinned(list(active_sessions))
+    
+    if pool is not None:
+        response = pool.recognize(camera_id, rgb_small_frame, gallery.version, hot_set.user_ids())
+        if response is None:
+            return None
+        results, worker_timings = response
+        timings.update(worker_timings)
+        # The worker owns the real tracker; mirror its encoding counters for the camera stats
+        encoded = sum(1 for result in results if result.get('encoded'))
+        tracker.record_encodings(encoded, len(results) - encoded)
+    else:
+        results = recognize_tracks(rgb_small_frame, tracker, gallery, tolerance=0.5, timings=timings,
+                                   detector=detector, quality_gate=quality_gate, hot_set=hot_set,
+                                   unknown_cache=unknown_cache)
+    
+    # Debug: Log face detection
+    if len(results) > 0:
+        if frame_count % 30 == 0:  # Log every 30 frames
+            print(f"Camera {camera_id}: Detected {len(results)} face(s) in frame {frame_count}")
+    
+    # Hot set and unknown cache hit rates over the faces that were matched this frame
+    hot_flags = [result.get('hot') for result in results if result.get('hot') is not None]
+    if hot_flags:
+        hot_set.record(sum(hot_flags), len(hot_flags) - sum(hot_flags))
+    unknown_flags = [result.get('unknown_cached') for result in results if result.get('unknown_cached') is not None]
+    if unknown_flags:
+        unknown_cache.record(sum(unknown_flags), len(unknown_flags) - sum(unknown_flags))
+    
+    face_locations = []
+    face_names = []
+    for result in results:
+        face_locations.append(result['box'])
+        quality = result.get('quality')
+        if quality is not None and quality_stats is not None:
+            quality_stats[quality] = quality_stats.get(quality, 0) + 1
+        user_id = result['user_id']
+        if user_id is None:
+            face_names.append("Unknown" if quality in (None, 'ok') else None)
+            continue
         
-        session = Session()
-        try:
-            current_time = datetime.now()
-            users_to_remove = []
-            
-            for user_id, session_data in list(active_sessions.items()):
-                time_since_last_seen = (current_time - session_data['last_seen']).total_seconds()
-                
-                # If user hasn't been seen for 30 seconds, mark as exited
-                if time_since_last_seen > 30:
-                    entry_time = session_data['entry_time']
-                    exit_time = session_data['last_seen']
-                    duration = (exit_time - entry_time).total_seconds() / 60  # in minutes
-                    
-                    # Update attendance record - find the most recent entry without exit
-                    today_str = current_time.strftime('%Y-%m-%d')
-                    attendance = session.query(Attendance).filter(
-                        Attendance.user_id == user_id,
-                        Attendance.entry_time == entry_time,
-                        Attendance.exit_time == None,
-                        Attendance.date == today_str
-                    ).first()
-                    
-                    if attendance:
-                        attendance.exit_time = exit_time
-                        attendance.duration_minutes = round(duration, 2)
-                        session.commit()
-                        user_name = session_data.get('user_name', 'Unknown')
-                        user_usn = session_data.get('user_usn', 'N/A')
-                        
-                        # Process slot-based attendance with exit time
-                        process_slot_attendance(user_id, user_name, user_usn, entry_time, exit_time, today_str)
-                        
-                        print(f"✓ Exit recorded: {user_name} - Duration: {duration:.2f} minutes")
-                    else:
-                        print(f"⚠ Warning: Could not find attendance record for user_id {user_id} with entry_time {entry_time}")
-                    
-                    users_to_remove.append(user_id)
-            
-            for user_id in users_to_remove:
-                if user_id in active_sessions:
-                    del active_sessions[user_id]
-        except Exception as e:
-            session.rollback()
-            print(f"✗ ERROR in check_exits: {e}")
-            import traceback
-            traceback.print_exc()
-        finally:
-            session.close()
+        user_name = result['user_name']
+        face_names.append(user_name)
+        user_usn = result['user_usn'] or ''
+        
+        # If USN is empty, try to get it from database
+        # (once per user - misses are cached too, so this never repeats per frame)
+        if not user_usn or user_usn == 'N/A':
+            if user_id not in usn_lookup_cache:
+                session_temp = Session()
+                try:
+                    user = session_temp.query(User).filter(User.id == user_id).first()
+                    usn_lookup_cache[user_id] = user.usn if user and user.usn else ''
+                finally:
+                    session_temp.close()
+            user_usn = usn_lookup_cache[user_id]
+        
+        if pool is not None:
+            hot_set.touch(user_id)  # The worker matched it; keep our copy of the hot set current
+        
+        if result['new_identity']:
+            print(f"✓ Face recognized: {user_name} (USN: {user_usn or 'N/A'}, ID: {user_id}) on camera {camera_id}")
+        
+        # For single door: detect entry (face appears)
+        process_attendance(user_id, user_name, user_usn, camera_id, is_entry=True)
+    
+    return face_locations, face_names
 
-def process_camera_feed(camera_id, camera_url):
+def process_camera_feed(camera_id, camera_url, camera_config=None):
     """Process video feed from a camera"""
+    if camera_config is None:
+        camera_config, _ = build_camera_config({})
     print(f"Starting camera feed: {camera_id} from {camera_url}")
-    print(f"Known faces loaded: {len(known_face_encodings)}")
+    print(f"Known faces loaded: {face_gallery_service.snapshot.num_encodings}")
     
-    cap = cv2.VideoCapture(camera_url)
+    # Capture runs in its own thread; this loop always works on the newest frame
+    grabber = FrameGrabber(camera_url)
     
     # Check if camera opened successfully
-    if not cap.isOpened():
+    if not grabber.start():
         error_msg = f"Error: Could not open camera {camera_id} at {camera_url}"
         print(error_msg)
         if camera_id in active_camera_threads:
             del active_camera_threads[camera_id]
         return
     
-    # Set camera properties for better performance
-    cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-    
-    process_this_frame = True
     frame_count = 0
     
     # Variables to hold results for display
     face_locations = []
     face_names = []
     
+    # Carries identities across frames so known faces are not re-encoded every frame
+    tracker = FaceTracker()
+    
+    # Per-camera detector backend (the worker process builds its own when the pool is used)
+    detector = create_detector(camera_config['detector'])
+    
+    # Detection only runs on the (downscaled) doorway region
+    roi = RegionOfInterest(camera_config['roi'], scale=camera_config['downscale'])
+    
+    # Skips the encoding for faces too small, blurred or turned away to match
+    quality_gate = FaceQualityGate(**camera_config['quality'])
+    quality_stats = {}
+    
+    # Skips detection while the doorway is empty and static
+    motion_gate = MotionGate(
+        sensitivity=camera_config['motion_sensitivity'],
+        keyframe_interval=camera_config['keyframe_interval']
+    )
+    
+    # Adapts the recognition cadence to measured cost and this camera's share of the CPU budget
+    scheduler = FrameScheduler(camera_id, recognition_budget, target_fps=camera_config['recognition_fps'])
+    recognition_budget.register(camera_id)
+    
+    # Hand recognition to a worker process when the pool is enabled
+    pool = get_recognition_pool()
+    if pool is not None:
+        pool.register_camera(camera_id, camera_config['detector'], camera_config['quality'])
+    
     while True:
-        ret, frame = cap.read()
-        if not ret:
-            print(f"Warning: Could not read frame from camera {camera_id}")
-            time.sleep(1)
-            # Try to reopen camera
-            cap.release()
-            cap = cv2.VideoCapture(camera_url)
-            if not cap.isOpened():
-                print(f"Error: Could not reopen camera {camera_id}")
+        frame, captured_at = grabber.read()
+        if frame is None:
+            if not grabber.running:
                 break
             continue
+        loop_start = time.time()
         
         frame_count += 1
         
-        # Resize frame for faster processing (1/4 size)
-        small_frame = cv2.resize(frame, (0, 0), fx=0.25, fy=0.25)
-        rgb_small_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
+        # Crop to the ROI and downscale for faster processing
+        small_frame = roi.crop(frame)
         
-        # Process every other frame to reduce CPU usage
-        if process_this_frame:
+        # Recognize at the scheduled cadence, and only when something moved
+        if scheduler.should_process(loop_start) and motion_gate.check(small_frame, has_faces=len(face_locations) > 0):
+            scheduler.mark_processed()
             try:
-                # Find faces and encodings
-                face_locations = face_recognition.face_locations(rgb_small_frame, model='hog')
-                face_encodings = face_recognition.face_encodings(rgb_small_frame, face_locations)
-                
-                face_names = []
-                
-                # Debug: Log face detection
-                if len(face_encodings) > 0:
-                    if frame_count % 30 == 0:  # Log every 30 frames
-                        print(f"Camera {camera_id}: Detected {len(face_encodings)} face(s) in frame {frame_count}")
-                
-                # Log when faces are detected but not recognized
-                if len(face_encodings) > 0:
-                    if len(known_face_encodings) == 0:
-                        face_names = ["Unknown"] * len(face_encodings)
-                    else:
-                        # Process ALL faces detected in the frame (multi-face support)
-                        recognized_in_frame = set()  # Track recognized users in this frame to avoid duplicates
-                        
-                        for face_encoding in face_encodings:
-                            # Compare faces with lower tolerance for better accuracy
-                            matches = face_recognition.compare_faces(known_face_encodings, face_encoding, tolerance=0.5)
-                            face_distances = face_recognition.face_distance(known_face_encodings, face_encoding)
-                            
-                            name = "Unknown"
-                            
-                            if True in matches:
-                                best_match_index = np.argmin(face_distances)
-                                # Only accept if distance is below threshold
-                                if matches[best_match_index] and face_distances[best_match_index] < 0.5:
-                                    user_id = known_face_ids[best_match_index]
-                                    user_name = known_face_names[best_match_index]
-                                    name = user_name
-                                    
-                                    # Get USN from known_face_usns array, or fetch from database if missing
-                                    if best_match_index < len(known_face_usns):
-                                        user_usn = known_face_usns[best_match_index] or ''
-                                    else:
-                                        user_usn = ''
-                                    
-                                    # If USN is empty, try to get it from database
-                                    if not user_usn or user_usn == 'N/A':
-                                        session_temp = Session()
-                                        try:
-                                            user = session_temp.query(User).filter(User.id == user_id).first()
-                                            if user and user.usn:
-                                                user_usn = user.usn
-                                                # Update the known_face_usns array
-                                                if best_match_index < len(known_face_usns):
-                                                    known_face_usns[best_match_index] = user_usn
-                                        finally:
-                                            session_temp.close()
-                                    
-                                    # Only process if not already recognized in this frame
-                                    if user_id not in recognized_in_frame:
-                                        # For single door: detect entry (face appears)
-                                        process_attendance(user_id, user_name, user_usn or '', camera_id, is_entry=True)
-                                        recognized_in_frame.add(user_id)
-                                        print(f"✓ Face recognized: {user_name} (USN: {user_usn or 'N/A'}, ID: {user_id}) on camera {camera_id}")
-                            
-                            face_names.append(name)
-                            
+                recognize_start = time.time()
+                rgb_small_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
+                timings = {}
+                recognized = recognize_frame(camera_id, rgb_small_frame, tracker, frame_count, timings, pool, detector,
+                                             quality_gate, quality_stats)
+                if recognized is not None:
+                    face_locations, face_names = recognized
+                for stage, seconds in timings.items():
+                    scheduler.record(stage, seconds)
+                scheduler.record('recognize', time.time() - recognize_start)
+                # Capture-to-result latency, bounded because we never work on queued frames
+                scheduler.record('latency', time.time() - captured_at)
             except Exception as e:
                 print(f"Error processing frame from camera {camera_id}: {e}")
                 import traceback
                 traceback.print_exc()
         
-        process_this_frame = not process_this_frame
-        
         # Draw results on the frame for streaming
-        for (top, right, bottom, left), name in zip(face_locations, face_names):
-            # Scale back up face locations since the frame we detected in was scaled to 1/4 size
-            top *= 4
-            right *= 4
-            bottom *= 4
-            left *= 4
+        draw_start = time.time()
+        if roi.points:
+            cv2.polylines(frame, [np.array(roi.points, dtype=np.int32)], True, (255, 255, 0), 1)
+        for box, name in zip(face_locations, face_names):
+            # Map face locations from the downscaled crop back to the full frame
+            top, right, bottom, left = roi.to_frame(box)
+
+            # Faces below the quality gate just get a thin grey box until a usable view arrives
+            if name is None:
+                cv2.rectangle(frame, (left, top), (right, bottom), (160, 160, 160), 1)
+                continue
 
             # Draw a box around the face
             color = (0, 255, 0) if name != "Unknown" else (0, 0, 255)
@@ -853,35 +1417,154 @@ def process_camera_feed(camera_id, camera_url):
             cv2.rectangle(frame, (left, bottom - 35), (right, bottom), color, cv2.FILLED)
             font = cv2.FONT_HERSHEY_DUPLEX
             cv2.putText(frame, name, (left + 6, bottom - 6), font, 0.75, (255, 255, 255), 1)
-            
+        
+        # Encode frame to JPEG outside the lock
+        ret, buffer = cv2.imencode('.jpg', frame)
+        scheduler.record('stream', time.time() - draw_start)
+        
         # Store the latest frame for streaming
         with frame_lock:
             if camera_id in active_camera_threads:
-                # Encode frame to JPEG
-                ret, buffer = cv2.imencode('.jpg', frame)
                 if ret:
                     active_camera_threads[camera_id]['latest_frame'] = buffer.tobytes()
-        
-        time.sleep(0.033)  # ~30 FPS processing
+                active_camera_threads[camera_id]['stats'] = {
+                    **scheduler.stats(),
+                    **grabber.stats(),
+                    **motion_gate.stats(),
+                    **tracker.stats(),
+                    'detection_pixel_ratio': round(roi.pixel_ratio(), 3),
+                    'quality_gate': dict(quality_stats)
+                }
     
-    cap.release()
+    grabber.stop()
+    recognition_budget.unregister(camera_id)
+    if pool is not None:
+        pool.unregister_camera(camera_id)
     with frame_lock:
         if camera_id in active_camera_threads:
             del active_camera_threads[camera_id]
     print(f"Camera feed {camera_id} stopped")
 
-# Background thread to check for exits
+# Fork the recognition workers now, before any background thread exists, so no worker
+# inherits a lock another thread was holding (stdout, the attendance journal)
+get_recognition_pool()
+
+# Background thread to check for exits: sleeps until the earliest exit timer is due
+# (or a first timer is armed), so exits are recorded right as they time out
 def exit_checker_thread():
     while True:
+        exit_timers_changed.clear()
         check_exits()
-        time.sleep(10)  # Check every 10 seconds
+        exit_timers_changed.wait(next_exit_deadline())
 
 # Start exit checker thread
 exit_thread = threading.Thread(target=exit_checker_thread, daemon=True)
 exit_thread.start()
 
+# Background thread that writes Absent rows as each class slot ends, so the slot
+# attendance reads never have to fill in missing students themselves
+def absence_scheduler_thread():
+    materialized = set()  # (date, slot_id) already done
+    caught_up_for = None  # Date on which past days were last caught up
+    
+    while True:
+        now = datetime.now()
+        today_str = now.strftime('%Y-%m-%d')
+        if caught_up_for != today_str:
+            # Startup or a new day: every past date not done yet (upgrade, downtime, missed slots)
+            try:
+                catch_up_absences((now - timedelta(days=1)).strftime('%Y-%m-%d'))
+                caught_up_for = today_str
+            except Exception as e:
+                print(f"✗ ERROR marking absences for past dates: {e}")
+        if slot_schedule_changed.is_set():
+            # Slots were edited - re-check today's ended slots (inserting is idempotent)
+            slot_schedule_changed.clear()
+            materialized.clear()
+        materialized = {key for key in materialized if key[0] == today_str}
+        
+        schedule = get_slot_schedule(today_str)
+        due = [slot['id'] for slot in schedule['slots']
+               if slot['end'] <= now and (today_str, slot['id']) not in materialized]
+        if due:
+            try:
+                # Students still inside get their row from process_slot_attendance when they exit
+                inserted = materialize_absences(today_str, set(due), exclude_user_ids=list(active_sessions))
+                materialized.update((today_str, slot_id) for slot_id in due)
+                print(f"✓ Marked {inserted} absences for {len(due)} ended slot(s) on {today_str}")
+            except Exception as e:
+                print(f"✗ ERROR marking absences for {today_str}: {e}")
+        
+        # Sleep until the next slot ends (or midnight); re-check at least every
+        # SLOT_SCHEDULE_TTL so slot edits made by another process are picked up
+        midnight = datetime.combine(now.date() + timedelta(days=1), dt_time())
+        next_end = min([slot['end'] for slot in schedule['slots'] if slot['end'] > now] + [midnight])
+        slot_schedule_changed.wait(max(1.0, min((next_end - now).total_seconds(), SLOT_SCHEDULE_TTL)))
+
+absence_thread = threading.Thread(target=absence_scheduler_thread, daemon=True)
+absence_thread.start()
+
+# Slot attendance recomputes (admin endpoint, slot time edits) run one at a time in the background
+slot_recompute_queue = queue.Queue()
+slot_recompute_lock = threading.Lock()
+slot_recompute_status = {'running': None, 'queued': [], 'last': None}
+slot_recompute_ids = itertools.count(1)
+
+def queue_slot_recompute(start_date, end_date, slot_ids=None, reason='admin'):
+    """Queue a recompute of slot_attendance for a date range; returns the job dict"""
+    with slot_recompute_lock:
+        job = {
+            'id': next(slot_recompute_ids),
+            'start_date': start_date,
+            'end_date': end_date,
+            'slot_ids': list(slot_ids) if slot_ids is not None else None,
+            'reason': reason,
+            'queued_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'progress': {'dates_done': 0, 'dates_total': None, 'rows_written': 0},
+            'result': None,
+            'error': None
+        }
+        slot_recompute_status['queued'].append(job)
+    slot_recompute_queue.put(job)
+    return job
+
+def slot_recompute_thread():
+    while True:
+        job = slot_recompute_queue.get()
+        with slot_recompute_lock:
+            slot_recompute_status['queued'].remove(job)
+            slot_recompute_status['running'] = job
+        
+        def report(dates_done, dates_total, rows_written):
+            with slot_recompute_lock:
+                job['progress'] = {'dates_done': dates_done, 'dates_total': dates_total, 'rows_written': rows_written}
+        
+        try:
+            # Entries and exits still in the journal should be part of the recompute
+            attendance_journal.flush()
+            job['result'] = recompute_slot_attendance(engine, job['start_date'], job['end_date'], job['slot_ids'],
+                                                      progress=report, class_days=CLASS_DAYS)
+            print(f"✓ Recomputed slot attendance {job['start_date']}..{job['end_date']}: "
+                  f"{job['result']['rows']} rows in {job['result']['seconds']}s")
+        except Exception as e:
+            job['error'] = str(e)
+            print(f"✗ ERROR recomputing slot attendance {job['start_date']}..{job['end_date']}: {e}")
+            traceback.print_exc()
+        with slot_recompute_lock:
+            slot_recompute_status['running'] = None
+            slot_recompute_status['last'] = job
+
+slot_recompute_worker = threading.Thread(target=slot_recompute_thread, daemon=True)
+slot_recompute_worker.start()
+
 # Load known faces on startup
 load_known_faces()
+gallery_snapshot_worker = threading.Thread(target=gallery_snapshot_thread, daemon=True)
+gallery_snapshot_worker.start()
+
+# Apply events left in the journal by a previous run, then start the attendance writer
+attendance_journal.start()
+load_open_attendance()
 
 # Login required decorator
 def login_required(f):
@@ -994,7 +1677,8 @@ def add_user():
         user = User(
             name=name,
             usn=usn,
-            face_encodings=json.dumps([face_encoding.tolist()]),
+            face_encodings='',
+            face_encoding_blob=encodings_to_bytes([face_encoding]),
             image_paths=json.dumps([filepath]),
             status='approved',
             approved_at=datetime.now(),
@@ -1003,8 +1687,8 @@ def add_user():
         db_session.add(user)
         db_session.commit()
         
-        # Reload known faces
-        load_known_faces()
+        # Add the new user to the live gallery
+        update_known_face(user)
         
         print(f"User added successfully: {name} ({usn})")
         return jsonify({
@@ -1069,8 +1753,8 @@ def delete_user(user_id):
         session.delete(user)
         session.commit()
         
-        # Reload known faces
-        load_known_faces()
+        # Drop the user from the live gallery
+        remove_known_face(user_id)
         
         print(f"User deleted: {user_name} (ID: {user_id})")
         return jsonify({
@@ -1169,7 +1853,9 @@ def cameras():
                     'camera_id': camera_id,
                     'camera_url': str(camera_data.get('camera_url', 'N/A')),
                     'started_at': camera_data.get('started_at', datetime.now()).strftime('%Y-%m-%d %H:%M:%S') if isinstance(camera_data.get('started_at'), datetime) else str(camera_data.get('started_at', 'N/A')),
-                    'status': 'running'
+                    'status': 'running',
+                    'config': camera_data.get('config', {}),
+                    'stats': camera_data.get('stats', {})
                 })
         return jsonify(cameras_list), 200
     
@@ -1190,7 +1876,7 @@ def cameras():
             return jsonify({'error': f'Camera {camera_id} is already running'}), 400
     
     # Check if we have any registered users (warning only, not blocking)
-    if len(known_face_encodings) == 0:
+    if face_gallery_service.snapshot.num_encodings == 0:
         print("Warning: Starting camera without registered users. Face recognition will not work.")
     
     # Convert camera_url to int if it's a number string
@@ -1200,10 +1886,15 @@ def cameras():
     except:
         pass  # Keep as string if it's an RTSP URL
     
+    # Per-camera processing options
+    camera_config, error = build_camera_config(data)
+    if error:
+        return jsonify({'error': error}), 400
+    
     # Start processing thread for this camera
     thread = threading.Thread(
         target=process_camera_feed,
-        args=(camera_id, camera_url),
+        args=(camera_id, camera_url, camera_config),
         daemon=True
     )
     thread.start()
@@ -1213,14 +1904,15 @@ def cameras():
             'thread': thread,
             'camera_url': camera_url,
             'started_at': datetime.now(),
-            'latest_frame': None
+            'latest_frame': None,
+            'config': camera_config
         }
     
-    print(f"Camera {camera_id} thread started. Total known faces: {len(known_face_encodings)}")
+    print(f"Camera {camera_id} thread started. Total known faces: {face_gallery_service.snapshot.num_encodings}")
     return jsonify({
         'message': f'Camera {camera_id} started successfully',
         'camera_id': camera_id,
-        'known_faces_count': len(known_face_encodings)
+        'known_faces_count': face_gallery_service.snapshot.num_encodings
     }), 200
 
 def generate_frames(camera_id):
@@ -1267,12 +1959,17 @@ def get_status():
         
         return jsonify({
             'users_registered': user_count,
-            'known_faces_loaded': len(known_face_encodings),
+            'known_faces_loaded': face_gallery_service.snapshot.num_encodings,
+            'gallery_version': face_gallery_service.version,
             'attendance_records': attendance_count,
             'recent_attendance_24h': recent_attendance,
             'active_sessions': active_count,
             'active_cameras': camera_count,
-            'camera_list': list(active_camera_threads.keys())
+            'camera_list': list(active_camera_threads.keys()),
+            'recognition_workers': recognition_pool.stats() if recognition_pool is not None else None,
+            'attendance_journal': attendance_journal.stats(),
+            'hot_set': hot_set.stats(),
+            'unknown_cache': unknown_cache.stats()
         })
     finally:
         session.close()
@@ -1392,7 +2089,8 @@ def register_student():
             name=name,
             usn=usn,
             password=password if password else None,
-            face_encodings=json.dumps(face_encodings_list),
+            face_encodings='',
+            face_encoding_blob=encodings_to_bytes(face_encodings_list),
             image_paths=json.dumps(image_paths),
             status='pending'
         )
@@ -1530,12 +2228,13 @@ def student_profile(usn):
                     if os.path.exists(path):
                         os.remove(path)
                 
-                user.face_encodings = json.dumps(face_encodings_list)
+                user.face_encodings = ''
+                user.face_encoding_blob = encodings_to_bytes(face_encodings_list)
                 user.image_paths = json.dumps(image_paths)
                 session.commit()
                 
                 if user.status == 'approved':
-                    load_known_faces()
+                    update_known_face(user)
                 
                 return jsonify({'message': 'Profile updated successfully'}), 200
             else:
@@ -1578,7 +2277,7 @@ def approve_student(user_id):
         user.approved_by = admin_email
         db_session.commit()
         
-        load_known_faces()
+        update_known_face(user)
         
         return jsonify({'message': f'Student {user.name} approved successfully'}), 200
     finally:
@@ -1603,6 +2302,9 @@ def reject_student(user_id):
         user.status = 'rejected'
         session.commit()
         
+        # Make sure a previously approved user stops being recognized
+        update_known_face(user)
+        
         return jsonify({'message': f'Student {user.name} rejected'}), 200
     finally:
         session.close()
@@ -1651,18 +2353,19 @@ def get_analytics():
         # Currently inside
         currently_inside = len(active_sessions)
         
-        # Slot-based statistics
+        # Slot-based statistics (Absent rows are written when each slot ends)
         slots = get_class_slots_for_date(date_filter)
-        slot_attendance = session.query(SlotAttendance).filter(
-            SlotAttendance.date == date_filter
-        ).all()
+        status_counts = {}
+        for slot_id, status, count in session.query(
+            SlotAttendance.slot_id, SlotAttendance.status, func.count(SlotAttendance.id)
+        ).filter(SlotAttendance.date == date_filter).group_by(SlotAttendance.slot_id, SlotAttendance.status):
+            status_counts[(slot_id, status)] = count
         
         slot_stats = []
         for slot in slots:
-            slot_records = [r for r in slot_attendance if r.slot_id == slot.id]
-            present_count = len([r for r in slot_records if r.status in ['Present', 'Late']])
-            absent_count = len([r for r in slot_records if r.status == 'Absent'])
-            late_count_slot = len([r for r in slot_records if r.status == 'Late'])
+            late_count_slot = status_counts.get((slot.id, 'Late'), 0)
+            present_count = status_counts.get((slot.id, 'Present'), 0) + late_count_slot
+            absent_count = status_counts.get((slot.id, 'Absent'), 0)
             
             slot_stats.append({
                 'slot_id': slot.id,
@@ -1759,6 +2462,7 @@ def class_time():
                 settings.last_updated = datetime.now()
             
             session.commit()
+            invalidate_class_settings()
             
             return jsonify({
                 'message': 'Class settings updated successfully',
@@ -1856,6 +2560,7 @@ def class_slots():
             )
             session.add(slot)
             session.commit()
+            invalidate_slot_schedules()
             
             # Calculate duration
             duration_minutes = end_total - start_total
@@ -1891,6 +2596,7 @@ def class_slot_detail(slot_id):
         if request.method == 'PUT':
             # Update slot
             data = request.get_json()
+            previous_times = (slot.start_time, slot.end_time, slot.day_of_week)
             class_name = data.get('class_name') or data.get('subject_name')
             start_time = data.get('start_time')
             end_time = data.get('end_time')
@@ -1924,6 +2630,7 @@ def class_slot_detail(slot_id):
                     return jsonify({'error': 'Invalid end_time format. Use HH:MM'}), 400
             if day_of_week is not None:
                 slot.day_of_week = day_of_week
+            times_changed = (slot.start_time, slot.end_time, slot.day_of_week) != previous_times
             
             # Validate end_time is after start_time
             start_parts = slot.start_time.split(':')
@@ -1935,6 +2642,17 @@ def class_slot_detail(slot_id):
             
             slot.updated_at = datetime.now()
             session.commit()
+            invalidate_slot_schedules()
+            
+            # Existing rows were computed against the old times - rebuild them in the background
+            recompute_job = None
+            if times_changed:
+                first_date = session.query(func.min(SlotAttendance.date)).filter(
+                    SlotAttendance.slot_id == slot.id
+                ).scalar()
+                if first_date:
+                    recompute_job = queue_slot_recompute(first_date, datetime.now().strftime('%Y-%m-%d'),
+                                                         [slot.id], reason=f'slot {slot.id} edited')
             
             duration_minutes = end_total - start_total
             
@@ -1945,6 +2663,7 @@ def class_slot_detail(slot_id):
                 'end_time': slot.end_time,
                 'duration_minutes': duration_minutes,
                 'day_of_week': slot.day_of_week,
+                'recompute_job_id': recompute_job['id'] if recompute_job else None,
                 'message': 'Class slot updated successfully'
             }), 200
         else:
@@ -1952,6 +2671,7 @@ def class_slot_detail(slot_id):
             slot_name = slot.class_name
             session.delete(slot)
             session.commit()
+            invalidate_slot_schedules()
             return jsonify({'message': f'Class slot "{slot_name}" deleted successfully'}), 200
     except Exception as e:
         session.rollback()
@@ -1962,6 +2682,31 @@ def class_slot_detail(slot_id):
     finally:
         session.close()
 
+@app.route('/api/admin/slot-attendance/recompute', methods=['GET', 'POST'])
+@login_required
+def slot_attendance_recompute():
+    """Start a slot attendance recompute over a date range (POST) or report progress (GET)"""
+    if request.method == 'GET':
+        with slot_recompute_lock:
+            return jsonify(slot_recompute_status), 200
+    
+    data = request.get_json() or {}
+    start_date = data.get('start_date')
+    end_date = data.get('end_date') or datetime.now().strftime('%Y-%m-%d')
+    slot_ids = data.get('slot_ids')
+    try:
+        if not start_date:
+            return jsonify({'error': 'start_date is required (format: YYYY-MM-DD)'}), 400
+        if datetime.strptime(start_date, '%Y-%m-%d') > datetime.strptime(end_date, '%Y-%m-%d'):
+            return jsonify({'error': 'start_date must not be after end_date'}), 400
+        if slot_ids is not None:
+            slot_ids = [int(slot_id) for slot_id in slot_ids]
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid dates (YYYY-MM-DD) or slot_ids'}), 400
+    
+    job = queue_slot_recompute(start_date, end_date, slot_ids)
+    return jsonify({'message': 'Recompute queued', 'job_id': job['id']}), 202
+
 @app.route('/api/reports/export', methods=['GET'])
 @login_required
 def export_attendance_report():
@@ -2461,16 +3206,12 @@ def export_daily_report():
                 'USN': student.usn
             }
             
-            # Add status for each slot
+            # Add status for each slot (blank until the student is seen or the slot ends)
             for slot in slots:
-                key = (student.id, slot.id)
-                if key in attendance_map:
-                    record = attendance_map[key]
-                    row[f"{slot.class_name} ({slot.start_time}-{slot.end_time})"] = record.status
-                    if record.overlap_minutes:
-                        row[f"{slot.class_name} Overlap (min)"] = round(record.overlap_minutes, 2)
-                else:
-                    row[f"{slot.class_name} ({slot.start_time}-{slot.end_time})"] = 'Absent'
+                record = attendance_map.get((student.id, slot.id))
+                row[f"{slot.class_name} ({slot.start_time}-{slot.end_time})"] = record.status if record else ''
+                if record and record.overlap_minutes:
+                    row[f"{slot.class_name} Overlap (min)"] = round(record.overlap_minutes, 2)
             
             data.append(row)
         
@@ -2502,7 +3243,7 @@ def export_daily_report():
                 row = [str(row_dict['ID']), row_dict['Name'], row_dict['USN']]
                 for slot in slots:
                     col_name = f"{slot.class_name} ({slot.start_time}-{slot.end_time})"
-                    status = row_dict.get(col_name, 'Absent')
+                    status = row_dict.get(col_name, '')
                     row.append(status)
                 table_data.append(row)
             
@@ -2582,27 +3323,19 @@ def get_slot_attendance():
                 'slot_attendance': []
             }
             
+            # Only stored rows: a slot shows up once the student is seen or the slot has ended
             for slot in slots:
-                key = (student.id, slot.id)
-                if key in attendance_map:
-                    record = attendance_map[key]
-                    student_data['slot_attendance'].append({
-                        'slot_id': slot.id,
-                        'slot_name': slot.class_name,
-                        'status': record.status,
-                        'entry_time': record.entry_time.strftime('%H:%M:%S') if record.entry_time else None,
-                        'exit_time': record.exit_time.strftime('%H:%M:%S') if record.exit_time else None,
-                        'overlap_minutes': round(record.overlap_minutes, 2) if record.overlap_minutes else 0
-                    })
-                else:
-                    student_data['slot_attendance'].append({
-                        'slot_id': slot.id,
-                        'slot_name': slot.class_name,
-                        'status': 'Absent',
-                        'entry_time': None,
-                        'exit_time': None,
-                        'overlap_minutes': 0
-                    })
+                record = attendance_map.get((student.id, slot.id))
+                if record is None:
+                    continue
+                student_data['slot_attendance'].append({
+                    'slot_id': slot.id,
+                    'slot_name': slot.class_name,
+                    'status': record.status,
+                    'entry_time': record.entry_time.strftime('%H:%M:%S') if record.entry_time else None,
+                    'exit_time': record.exit_time.strftime('%H:%M:%S') if record.exit_time else None,
+                    'overlap_minutes': round(record.overlap_minutes, 2) if record.overlap_minutes else 0
+                })
             
             result['students'].append(student_data)
         
@@ -0,0 +1,221 @@
+"""
+Write-behind journal for attendance events.
+
+Camera threads used to commit Attendance/SlotAttendance rows to SQLite
+themselves, under the global attendance lock. Now they only emit() an entry or
+exit event: it is appended to an append-only log file (flushed, so a crash of
+the process loses nothing) and queued in memory. A single writer thread wakes
+every `interval` seconds and applies everything queued in one transaction.
+
+Once the queue is drained and committed the log is truncated. An event that
+cannot be applied (e.g. "database is locked" while a long job holds the write
+lock) is not dropped: it stays in the log and is retried with exponential
+backoff. On startup any events still in the log (the process died before they
+were applied) are replayed first, so the apply callback must be idempotent.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+DEFAULT_FLUSH_INTERVAL = 0.25
+DEFAULT_MAX_BATCH = 500
+# Failed events are retried after this many seconds, doubling per failed round up to the max
+DEFAULT_RETRY_DELAY = 1.0
+DEFAULT_MAX_RETRY_DELAY = 30.0
+
+
+def encode_event(event):
+    """JSON line for the log (datetimes as ISO strings)"""
+    return json.dumps({key: value.isoformat() if isinstance(value, datetime) else value
+                       for key, value in event.items()})
+
+
+def decode_event(line, datetime_fields):
+    event = json.loads(line)
+    for key in datetime_fields:
+        if event.get(key):
+            event[key] = datetime.fromisoformat(event[key])
+    return event
+
+
+class AttendanceJournal:
+    """In-memory event queue + durable log, drained by one batched DB writer"""
+
+    def __init__(self, path, apply_batch, interval=DEFAULT_FLUSH_INTERVAL, max_batch=DEFAULT_MAX_BATCH,
+                 datetime_fields=()):
+        self.path = path
+        self.apply_batch = apply_batch   # Callable(list of events), one transaction per call
+        self.interval = interval
+        self.max_batch = max_batch
+        self.datetime_fields = tuple(datetime_fields)
+        self.lock = threading.Lock()
+        self.pending = deque()
+        self.in_flight = 0
+        # Events that failed to apply, retried (first) once retry_at has passed
+        self.retry = deque()
+        self.retry_delay = DEFAULT_RETRY_DELAY
+        self.retry_at = 0.0
+        self.wake = threading.Event()
+        self.idle = threading.Condition(self.lock)
+        self.thread = None
+        self.log = None
+        # Metrics
+        self.events_emitted = 0
+        self.events_applied = 0
+        self.events_failed = 0
+        self.batches = 0
+        self.last_batch_size = 0
+        self.last_batch_ms = 0.0
+
+    def replay(self):
+        """Apply events a previous run logged but never committed; returns how many"""
+        if not os.path.exists(self.path):
+            return 0
+        events = []
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    events.append(decode_event(line, self.datetime_fields))
+                except ValueError:
+                    print(f"⚠ Warning: Skipping corrupt journal line: {line[:80]}")
+        failed = []
+        for start in range(0, len(events), self.max_batch):
+            failed.extend(self.apply(events[start:start + self.max_batch]))
+        # Only what could not be applied stays in the log; the writer retries it
+        self.write_log(failed)
+        if failed:
+            self.schedule_retry(failed)
+        return len(events)
+
+    def write_log(self, events):
+        """Atomically replace the log file with just these events"""
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for event in events:
+                f.write(encode_event(event) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def schedule_retry(self, failed, backoff=False):
+        """
+        Queue failed events for another attempt after retry_delay (lock held, or writer not
+        started yet); backoff=True doubles the delay first (a retry failed again)
+        """
+        if backoff:
+            self.retry_delay = min(self.retry_delay * 2, DEFAULT_MAX_RETRY_DELAY)
+        self.retry.extend(failed)
+        self.retry_at = time.time() + self.retry_delay
+
+    def start(self):
+        replayed = self.replay()
+        if replayed:
+            print(f"✓ Replayed {replayed} attendance events from {self.path}")
+        self.log = open(self.path, 'a', encoding='utf-8')
+        self.thread = threading.Thread(target=self.run, daemon=True, name='attendance-writer')
+        self.thread.start()
+
+    def emit(self, event):
+        """Record an event; never touches the database"""
+        line = encode_event(event)
+        with self.lock:
+            if self.log is not None:
+                self.log.write(line + '\n')
+                self.log.flush()
+            self.pending.append(event)
+            self.events_emitted += 1
+
+    def run(self):
+        while True:
+            self.wake.wait(self.interval)
+            self.wake.clear()
+            with self.lock:
+                batch = []
+                if self.retry and time.time() >= self.retry_at:
+                    batch = [self.retry.popleft() for _ in range(min(self.max_batch, len(self.retry)))]
+                retried = len(batch)
+                while self.pending and len(batch) < self.max_batch:
+                    batch.append(self.pending.popleft())
+                if not batch:
+                    continue
+                self.in_flight = len(batch)
+
+            # Outside the lock: emit() must never wait on the disk. The batch's lines were
+            # written (and flushed) before it was queued, so this sync covers all of them.
+            if self.log is not None:
+                os.fsync(self.log.fileno())
+            failed = self.apply(batch)
+
+            with self.lock:
+                self.in_flight = 0
+                if failed:
+                    self.schedule_retry(failed, backoff=retried > 0)
+                elif retried and not self.retry:
+                    self.retry_delay = DEFAULT_RETRY_DELAY  # Recovered
+                if not self.pending:
+                    # Everything logged so far is committed, except events waiting for a
+                    # retry: the log is cut down to just those
+                    if self.log is not None:
+                        if self.retry:
+                            self.log.close()
+                            self.write_log(self.retry)
+                            self.log = open(self.path, 'a', encoding='utf-8')
+                        else:
+                            self.log.truncate(0)
+                            self.log.seek(0)
+                    if not self.retry:
+                        self.idle.notify_all()
+                else:
+                    self.wake.set()  # Burst: keep draining without waiting
+
+    def apply(self, batch):
+        """
+        One transaction for the batch; if it fails, retry event by event to isolate the bad one.
+        Returns the events that could not be applied.
+        """
+        start = time.time()
+        failed = []
+        try:
+            self.apply_batch(batch)
+        except Exception as e:
+            print(f"⚠ Warning: Attendance batch of {len(batch)} failed ({e}), applying one by one")
+            for event in batch:
+                try:
+                    self.apply_batch([event])
+                except Exception as event_error:
+                    print(f"✗ ERROR applying attendance event {event}, will retry: {event_error}")
+                    failed.append(event)
+        applied = len(batch) - len(failed)
+        with self.lock:
+            self.events_applied += applied
+            self.events_failed += len(failed)
+            self.batches += 1
+            self.last_batch_size = len(batch)
+            self.last_batch_ms = (time.time() - start) * 1000
+        return failed
+
+    def flush(self, timeout=5.0):
+        """Block until everything emitted so far is applied (shutdown, reports)"""
+        self.wake.set()
+        with self.lock:
+            return self.idle.wait_for(lambda: not self.pending and not self.in_flight and not self.retry, timeout)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'pending': len(self.pending) + self.in_flight,
+                'emitted': self.events_emitted,
+                'applied': self.events_applied,
+                'failed': self.events_failed,
+                'retrying': len(self.retry),
+                'batches': self.batches,
+                'last_batch_size': self.last_batch_size,
+                'last_batch_ms': round(self.last_batch_ms, 2),
+            }
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Face Detector Benchmark
+
+Runs the detector backends from face_detectors.py over a local video file and
+reports throughput and recall, to pick a backend per door.
+
+There is no ground truth in a plain recording, so HOG (the detector the
+system has always used) is the reference: recall is the share of HOG faces a
+backend also finds (IoU >= --iou), and "extra" counts its boxes that HOG did
+not confirm (false positives or faces HOG misses).
+
+Frames go through the same preprocessing as the camera loop: optional ROI
+crop (x y width height) and the detection downscale.
+
+Usage:
+    python3 benchmark_face_detectors.py door1.mp4
+    python3 benchmark_face_detectors.py door1.mp4 --detectors hog haar two-stage --downscale 0.5 --max-frames 300
+"""
+
+import argparse
+import time
+
+import cv2
+
+from camera_pipeline import RegionOfInterest, box_iou, parse_roi
+from face_detectors import DETECTOR_TYPES, create_detector
+
+
+def load_frames(path, roi, max_frames, stride):
+    """Preprocessed RGB frames from the video (every stride-th frame)"""
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise SystemExit(f"Could not open video {path}")
+    frames = []
+    index = 0
+    while len(frames) < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        if index % stride == 0:
+            frames.append(cv2.cvtColor(roi.crop(frame), cv2.COLOR_BGR2RGB))
+        index += 1
+    cap.release()
+    return frames
+
+
+def run_detector(detector, frames):
+    """Boxes per frame and average milliseconds per frame"""
+    boxes = []
+    start = time.perf_counter()
+    for frame in frames:
+        boxes.append(detector.detect(frame))
+    elapsed = time.perf_counter() - start
+    return boxes, elapsed * 1000 / max(1, len(frames))
+
+
+def compare(reference, boxes, min_iou):
+    """(reference faces found, boxes with no reference match)"""
+    found = 0
+    extra = 0
+    for ref_boxes, det_boxes in zip(reference, boxes):
+        unmatched = list(det_boxes)
+        for ref in ref_boxes:
+            best = max(unmatched, key=lambda box: box_iou(ref, box), default=None)
+            if best is not None and box_iou(ref, best) >= min_iou:
+                found += 1
+                unmatched.remove(best)
+        extra += len(unmatched)
+    return found, extra
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark face detector backends on a video file')
+    parser.add_argument('video', help='Local video file (e.g. a recording from the door camera)')
+    parser.add_argument('--detectors', nargs='+', default=list(DETECTOR_TYPES), help='Backends to compare')
+    parser.add_argument('--downscale', type=float, default=0.25, help='Detection downscale, as in the camera config')
+    parser.add_argument('--roi', type=int, nargs=4, metavar=('X', 'Y', 'W', 'H'), help='Crop to this rectangle first')
+    parser.add_argument('--max-frames', type=int, default=300)
+    parser.add_argument('--stride', type=int, default=1, help='Use every Nth frame')
+    parser.add_argument('--iou', type=float, default=0.3, help='IoU needed to count as the same face')
+    args = parser.parse_args()
+
+    roi = RegionOfInterest(parse_roi(args.roi), scale=args.downscale)
+    frames = load_frames(args.video, roi, args.max_frames, args.stride)
+    if not frames:
+        raise SystemExit("No frames read from the video")
+    height, width = frames[0].shape[:2]
+    print(f"{len(frames)} frames at {width}x{height} (downscale {args.downscale})")
+
+    reference, reference_ms = run_detector(create_detector('hog'), frames)
+    total_faces = sum(len(boxes) for boxes in reference)
+    print(f"HOG reference: {total_faces} faces")
+    print(f"{'detector':>10} {'ms/frame':>9} {'fps':>7} {'faces':>6} {'recall':>7} {'extra':>6}")
+
+    for name in args.detectors:
+        try:
+            detector = create_detector(name)
+        except ValueError as e:
+            print(f"{name:>10}  skipped: {e}")
+            continue
+        if name == 'hog':
+            boxes, ms = reference, reference_ms
+        else:
+            boxes, ms = run_detector(detector, frames)
+        found, extra = compare(reference, boxes, args.iou)
+        recall = found / total_faces if total_faces else 1.0
+        fps = 1000 / ms if ms else float('inf')
+        print(f"{name:>10} {ms:>9.2f} {fps:>7.1f} {sum(len(b) for b in boxes):>6} {recall:>7.3f} {extra:>6}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Face Index Benchmark
+
+Compares the approximate IVF index (face_index.py) against the exact
+brute-force gallery scan on synthetic face encodings: recall of the exact
+match under the 0.5 tolerance and per-probe latency.
+
+Synthetic data: each user gets 2 encodings around a random identity centre
+(inter-person distances ~1.0, like real dlib encodings); probes are enrolled
+encodings plus noise (~0.35 away), with some strangers mixed in.
+
+Usage:
+    python3 benchmark_face_index.py
+    python3 benchmark_face_index.py --sizes 1000 10000 100000 --nprobe 4 8 16
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from face_gallery import FaceGallery, DEFAULT_TOLERANCE, ENCODING_DIM
+
+
+def make_gallery_users(num_encodings, rng):
+    """num_encodings synthetic encodings, 2 per user"""
+    num_users = max(1, num_encodings // 2)
+    centres = rng.normal(0, 1 / 16, (num_users, ENCODING_DIM))
+    photos = centres[:, None, :] + rng.normal(0, 0.15 / np.sqrt(ENCODING_DIM), (num_users, 2, ENCODING_DIM))
+    users = [(i, f"User {i}", f"USN{i:06d}", photos[i]) for i in range(num_users)]
+    return users, photos
+
+
+def make_probes(photos, num_probes, rng, stranger_ratio=0.2):
+    """Noisy views of enrolled users plus a share of strangers"""
+    num_users = len(photos)
+    num_strangers = int(num_probes * stranger_ratio)
+    picks = rng.integers(0, num_users, num_probes - num_strangers)
+    known = photos[picks, rng.integers(0, 2, len(picks))] + rng.normal(0, 0.35 / np.sqrt(ENCODING_DIM), (len(picks), ENCODING_DIM))
+    strangers = rng.normal(0, 1 / 16, (num_strangers, ENCODING_DIM))
+    return np.concatenate([known, strangers]).astype(np.float32)
+
+
+def time_per_probe(gallery, probes, batch_size):
+    """Average match latency per probe in milliseconds, plus the results"""
+    results = []
+    start = time.perf_counter()
+    for i in range(0, len(probes), batch_size):
+        results.extend(gallery.match_batch(probes[i:i + batch_size], tolerance=DEFAULT_TOLERANCE))
+    elapsed = time.perf_counter() - start
+    return elapsed * 1000 / len(probes), results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark IVF face index vs brute force')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help='Gallery sizes (encodings)')
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[4, 8, 16], help='IVF partitions scanned per probe')
+    parser.add_argument('--probes', type=int, default=500, help='Number of probe faces')
+    parser.add_argument('--batch', type=int, default=10, help='Faces per frame')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'encodings':>10} {'method':>14} {'build s':>8} {'ms/probe':>9} {'recall':>7}")
+    for size in args.sizes:
+        rng = np.random.default_rng(args.seed)
+        users, photos = make_gallery_users(size, rng)
+        probes = make_probes(photos, args.probes, rng)
+
+        gallery = FaceGallery(users)
+        exact_ms, exact_results = time_per_probe(gallery, probes, args.batch)
+        exact_ids = [idx for idx, _ in exact_results]
+        matched = sum(1 for idx in exact_ids if idx is not None)
+        print(f"{gallery.num_encodings:>10} {'brute force':>14} {0:>8.2f} {exact_ms:>9.3f} {1:>7.3f}")
+
+        for nprobe in args.nprobe:
+            start = time.perf_counter()
+            index = gallery.build_index('ivf', nprobe=nprobe)
+            build_s = time.perf_counter() - start
+            ivf_ms, ivf_results = time_per_probe(gallery, probes, args.batch)
+            # Recall = share of exact matches (under tolerance) the index also returns
+            hits = sum(1 for exact, (idx, _) in zip(exact_ids, ivf_results) if exact is not None and idx == exact)
+            recall = hits / matched if matched else 1.0
+            print(f"{gallery.num_encodings:>10} {f'ivf/{index.nlist} p={nprobe}':>14} {build_s:>8.2f} {ivf_ms:>9.3f} {recall:>7.3f}")
+        gallery.index = None
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,724 @@
+"""
+Per-camera processing helpers for the attendance system.
+
+FaceTracker associates face boxes across processed frames (IoU, with a centroid
+fallback for fast movement) and carries the recognized identity forward, so the
+expensive dlib encoding only runs for new faces, periodically for known tracks,
+or when a track's match confidence is low.
+
+MotionGate is a cheap frame-differencing check on the downscaled frame that lets
+an idle camera (empty, static doorway) skip HOG detection and encoding entirely,
+with a forced keyframe every few seconds.
+
+FaceQualityGate sits between detection and encoding: faces that are too small,
+too blurred (Laplacian variance) or turned too far away (5-point landmarks) are
+not worth a dlib encoding, so they skip it and stay unidentified until a better
+view comes along.
+
+recognize_tracks() is the detect -> track -> encode -> match step shared by the
+in-thread path and the recognition worker processes (recognition_workers.py).
+
+FrameScheduler replaces the fixed every-other-frame toggle: it measures stage
+latencies per camera and spaces recognitions to hit a target rate without going
+over the camera's fair share of the shared RecognitionBudget.
+
+RegionOfInterest crops each frame to the configured doorway (rectangle or
+polygon, pixels outside a polygon are blanked) and downscales the crop, so HOG
+only sees the pixels that matter; boxes are mapped back for the overlay.
+
+FrameGrabber decouples capture from inference: a reader thread per camera keeps
+grab()-ing so the decoder never builds a backlog, and only decodes a frame into
+the single latest-frame slot when the processing loop asks for one. Whatever is
+grabbed while the loop is busy is dropped, so a frame is at most one source
+frame old when processing starts, however slow inference gets.
+"""
+
+import threading
+import time
+
+import cv2
+import face_recognition
+import numpy as np
+
+# Re-encode a recognized track every N processed frames
+TRACK_REENCODE_INTERVAL = 10
+# Unknown tracks are retried more often (they might just have turned towards the camera)
+TRACK_UNKNOWN_REENCODE_INTERVAL = 3
+# Distance above which a match counts as low-confidence and is re-checked next frame
+TRACK_LOW_CONFIDENCE_DISTANCE = 0.45
+# Drop a track after this many processed frames without a matching detection
+TRACK_MAX_MISSED = 2
+TRACK_MIN_IOU = 0.3
+# Centroid fallback: max centroid shift as a fraction of the box size
+TRACK_MAX_CENTROID_SHIFT = 0.5
+
+# Fraction of pixels that must change before a frame counts as motion
+MOTION_SENSITIVITY = 0.01
+# Per-pixel grey-level change that counts as "changed"
+MOTION_PIXEL_THRESHOLD = 25
+# Run detection anyway every N checked frames, even without motion
+MOTION_KEYFRAME_INTERVAL = 30
+# How fast the background model follows slow changes (lighting)
+MOTION_LEARNING_RATE = 0.05
+
+# Quality gate defaults (0 disables a check): smallest face side in detection-frame
+# pixels, Laplacian variance of the face crop, and nose offset from the eye midpoint
+# as a fraction of the eye distance (~0 frontal, grows as the head turns)
+QUALITY_MIN_FACE_SIZE = 20
+QUALITY_MIN_SHARPNESS = 20.0
+QUALITY_MAX_YAW = 0.6
+
+# Recognitions per second each camera aims for
+RECOGNITION_TARGET_FPS = 5.0
+# Seconds of recognition work per wall-clock second, shared by all cameras (1.0 = one core)
+RECOGNITION_CPU_BUDGET = 1.0
+# Nominal source frame rate (used to report frames skipped between recognitions)
+SOURCE_FPS = 30.0
+# Weight of the newest sample in the stage latency averages
+LATENCY_EWMA_ALPHA = 0.2
+
+# Default downscale applied to the (cropped) frame before detection
+DETECTION_SCALE = 0.25
+
+# How long the processing loop waits for a new frame before checking the camera again
+CAPTURE_READ_TIMEOUT = 2.0
+# Pause before reopening a source that stopped delivering frames
+CAPTURE_RECONNECT_DELAY = 1.0
+
+
+def box_iou(a, b):
+    """IoU of two (top, right, bottom, left) boxes"""
+    top = max(a[0], b[0])
+    right = min(a[1], b[1])
+    bottom = min(a[2], b[2])
+    left = max(a[3], b[3])
+    inter = max(0, right - left) * max(0, bottom - top)
+    if inter == 0:
+        return 0.0
+    area_a = (a[1] - a[3]) * (a[2] - a[0])
+    area_b = (b[1] - b[3]) * (b[2] - b[0])
+    return inter / float(area_a + area_b - inter)
+
+
+def box_centroid(box):
+    top, right, bottom, left = box
+    return (left + right) / 2.0, (top + bottom) / 2.0
+
+
+class FaceTrack:
+    """One face followed across frames"""
+
+    def __init__(self, track_id, box, frame_index):
+        self.track_id = track_id
+        self.box = box
+        self.missed = 0
+        # Identity carried forward between encodings
+        self.user_id = None
+        self.user_name = None
+        self.user_usn = None
+        self.distance = None
+        self.gallery_version = None
+        self.last_encoded = None
+        self.created = frame_index
+        # Outcome of the latest quality check ('ok' or the failed check)
+        self.quality = None
+
+    @property
+    def name(self):
+        return self.user_name if self.user_id is not None else "Unknown"
+
+    def clear_identity(self):
+        self.user_id = None
+        self.user_name = None
+        self.user_usn = None
+        self.distance = None
+        self.last_encoded = None
+
+
+class FaceTracker:
+    """IoU/centroid tracker over face_locations of consecutive processed frames"""
+
+    def __init__(self, reencode_interval=TRACK_REENCODE_INTERVAL,
+                 unknown_reencode_interval=TRACK_UNKNOWN_REENCODE_INTERVAL,
+                 low_confidence_distance=TRACK_LOW_CONFIDENCE_DISTANCE,
+                 max_missed=TRACK_MAX_MISSED, min_iou=TRACK_MIN_IOU):
+        self.reencode_interval = reencode_interval
+        self.unknown_reencode_interval = unknown_reencode_interval
+        self.low_confidence_distance = low_confidence_distance
+        self.max_missed = max_missed
+        self.min_iou = min_iou
+        self.tracks = []
+        self.next_track_id = 1
+        self.frame_index = 0
+        # Metrics
+        self.encodings_run = 0
+        self.encodings_skipped = 0
+
+    def record_encodings(self, run, skipped):
+        self.encodings_run += run
+        self.encodings_skipped += skipped
+
+    def stats(self):
+        return {
+            'tracks': len(self.tracks),
+            'encodings_run': self.encodings_run,
+            'encodings_skipped': self.encodings_skipped,
+        }
+
+    def update(self, face_locations):
+        """
+        Associate this frame's detections with existing tracks.
+        Returns the tracks visible in this frame, in the same order as face_locations.
+        """
+        self.frame_index += 1
+        detections = list(face_locations)
+        matched_tracks = [None] * len(detections)
+        free_tracks = set(range(len(self.tracks)))
+
+        # Greedy IoU association, best overlap first
+        pairs = []
+        for t_idx, track in enumerate(self.tracks):
+            for d_idx, box in enumerate(detections):
+                iou = box_iou(track.box, box)
+                if iou >= self.min_iou:
+                    pairs.append((iou, t_idx, d_idx))
+        pairs.sort(reverse=True)
+        for _, t_idx, d_idx in pairs:
+            if t_idx in free_tracks and matched_tracks[d_idx] is None:
+                matched_tracks[d_idx] = self.tracks[t_idx]
+                free_tracks.discard(t_idx)
+
+        # Centroid fallback for faces that moved too far for any overlap
+        for d_idx, box in enumerate(detections):
+            if matched_tracks[d_idx] is not None:
+                continue
+            cx, cy = box_centroid(box)
+            size = max(box[1] - box[3], box[2] - box[0])
+            best = None
+            for t_idx in free_tracks:
+                tx, ty = box_centroid(self.tracks[t_idx].box)
+                shift = np.hypot(cx - tx, cy - ty)
+                if shift <= size * TRACK_MAX_CENTROID_SHIFT and (best is None or shift < best[0]):
+                    best = (shift, t_idx)
+            if best is not None:
+                matched_tracks[d_idx] = self.tracks[best[1]]
+                free_tracks.discard(best[1])
+
+        # Age out unmatched tracks
+        survivors = []
+        for t_idx, track in enumerate(self.tracks):
+            if t_idx in free_tracks:
+                track.missed += 1
+                if track.missed <= self.max_missed:
+                    survivors.append(track)
+
+        # Update matched tracks and start new ones
+        visible = []
+        for d_idx, box in enumerate(detections):
+            track = matched_tracks[d_idx]
+            if track is None:
+                track = FaceTrack(self.next_track_id, box, self.frame_index)
+                self.next_track_id += 1
+            track.box = box
+            track.missed = 0
+            survivors.append(track)
+            visible.append(track)
+
+        self.tracks = survivors
+        return visible
+
+    def needs_encoding(self, track, gallery_version):
+        """Whether this track must be (re-)encoded in the current frame"""
+        if track.last_encoded is None or track.gallery_version != gallery_version:
+            return True
+        age = self.frame_index - track.last_encoded
+        if track.user_id is None:
+            return age >= self.unknown_reencode_interval
+        if track.distance is not None and track.distance > self.low_confidence_distance:
+            return True
+        return age >= self.reencode_interval
+
+    def set_identity(self, track, gallery_version, user_id=None, user_name=None, user_usn=None, distance=None):
+        """Store a fresh match result on a track"""
+        track.user_id = user_id
+        track.user_name = user_name
+        track.user_usn = user_usn
+        track.distance = distance
+        track.gallery_version = gallery_version
+        track.last_encoded = self.frame_index
+        if user_id is None:
+            return
+        # One identity per face: a carried-forward track claiming the same user is re-checked
+        for other in self.tracks:
+            if other is not track and other.user_id == user_id:
+                other.clear_identity()
+
+
+class FaceQualityGate:
+    """Cheap size, sharpness and pose checks deciding whether a face is worth encoding"""
+
+    def __init__(self, min_size=QUALITY_MIN_FACE_SIZE, min_sharpness=QUALITY_MIN_SHARPNESS, max_yaw=QUALITY_MAX_YAW):
+        self.min_size = min_size
+        self.min_sharpness = min_sharpness
+        self.max_yaw = max_yaw
+
+    def sharpness(self, rgb_frame, box):
+        """Variance of the Laplacian over the face crop (low = blurred)"""
+        top, right, bottom, left = box
+        crop = rgb_frame[max(0, top):bottom, max(0, left):right]
+        if crop.size == 0:
+            return 0.0
+        grey = cv2.cvtColor(crop, cv2.COLOR_RGB2GRAY)
+        return float(cv2.Laplacian(grey, cv2.CV_64F).var())
+
+    def yaw(self, rgb_frame, box):
+        """Horizontal nose offset from the eye midpoint, relative to the eye distance"""
+        landmarks = face_recognition.face_landmarks(rgb_frame, [box], model='small')
+        if not landmarks:
+            return None
+        points = landmarks[0]
+        left_eye = np.mean(points['left_eye'], axis=0)
+        right_eye = np.mean(points['right_eye'], axis=0)
+        nose = np.mean(points['nose_tip'], axis=0)
+        eye_distance = np.hypot(*(right_eye - left_eye))
+        if eye_distance < 1:
+            return None
+        return float(abs(nose[0] - (left_eye[0] + right_eye[0]) / 2.0) / eye_distance)
+
+    def check(self, rgb_frame, box):
+        """'ok', or the name of the first failed check ('size', 'sharpness', 'pose'); cheapest first"""
+        top, right, bottom, left = box
+        if self.min_size and min(right - left, bottom - top) < self.min_size:
+            return 'size'
+        if self.min_sharpness and self.sharpness(rgb_frame, box) < self.min_sharpness:
+            return 'sharpness'
+        if self.max_yaw:
+            yaw = self.yaw(rgb_frame, box)
+            if yaw is None or yaw > self.max_yaw:
+                return 'pose'
+        return 'ok'
+
+
+def recognize_tracks(rgb_frame, tracker, gallery, tolerance=0.5, timings=None, detector=None, quality_gate=None,
+                     hot_set=None, unknown_cache=None):
+    """
+    Detect faces (with the given face_detectors backend, HOG by default), follow them
+    with the tracker, encode only the tracks that need it and pass the quality gate, and
+    match those against the gallery snapshot (the face_gallery.HotSet first, if given).
+    Faces close to a recent stranger in the face_gallery.UnknownCache skip matching.
+    Returns one dict per visible track: box, user_id, user_name, user_usn, distance,
+    new_identity, quality ('ok' or the failed check, None when the track was not checked
+    this frame), hot (whether the hot set answered) and unknown_cached (whether the
+    unknown cache answered) - both None when the track was not matched this frame - and
+    encoded (whether the track paid for an encoding this frame).
+    """
+    if timings is None:
+        timings = {}
+
+    # Find faces and follow them across frames
+    stage_start = time.time()
+    if detector is not None:
+        face_locations = detector.detect(rgb_frame)
+    else:
+        face_locations = face_recognition.face_locations(rgb_frame, model='hog')
+    tracks = tracker.update(face_locations)
+    timings['detect'] = time.time() - stage_start
+
+    # Only new tracks, low-confidence tracks and periodic re-checks pay for an encoding
+    to_encode = [track for track in tracks if tracker.needs_encoding(track, gallery.version)]
+    checked = set()
+    if quality_gate is not None and to_encode:
+        # Poor views keep their carried-forward identity and are retried next frame
+        stage_start = time.time()
+        for track in to_encode:
+            track.quality = quality_gate.check(rgb_frame, track.box)
+            checked.add(track.track_id)
+        to_encode = [track for track in to_encode if track.quality == 'ok']
+        timings['quality'] = time.time() - stage_start
+    tracker.record_encodings(len(to_encode), len(tracks) - len(to_encode))
+    encoded_ids = {track.track_id for track in to_encode}
+    previous_ids = {track.track_id: track.user_id for track in to_encode}
+    hot_by_track = {}
+    unknown_by_track = {}
+
+    if to_encode:
+        stage_start = time.time()
+        face_encodings = face_recognition.face_encodings(rgb_frame, [track.box for track in to_encode])
+        timings['encode'] = time.time() - stage_start
+
+        # One (M x users) distance pass for the whole frame; a user is never
+        # assigned to two faces in the same frame
+        stage_start = time.time()
+        # Recent strangers are Unknown straight away; everyone else is matched
+        if unknown_cache is not None:
+            cached_unknown = unknown_cache.lookup(face_encodings, gallery.version)
+        else:
+            cached_unknown = [None] * len(to_encode)
+        pending = [i for i in range(len(to_encode)) if not cached_unknown[i]]
+        matches = [(None, None)] * len(to_encode)
+        hot_hits = [None] * len(to_encode)
+        if pending:
+            pending_encodings = [face_encodings[i] for i in pending]
+            if hot_set is not None:
+                pending_matches, pending_hot = hot_set.match(gallery, pending_encodings, tolerance=tolerance)
+            else:
+                pending_matches, pending_hot = gallery.match_batch(pending_encodings, tolerance=tolerance), [None] * len(pending)
+            for i, match, hit in zip(pending, pending_matches, pending_hot):
+                matches[i] = match
+                hot_hits[i] = hit
+                if unknown_cache is not None and match[0] is None:
+                    unknown_cache.add(face_encodings[i], match[1], gallery.version)
+        timings['match'] = time.time() - stage_start
+        hot_by_track = {track.track_id: hit for track, hit in zip(to_encode, hot_hits)}
+        unknown_by_track = {track.track_id: hit for track, hit in zip(to_encode, cached_unknown)}
+
+        for track, (user_index, best_distance) in zip(to_encode, matches):
+            if user_index is None:
+                tracker.set_identity(track, gallery.version, distance=best_distance)
+            else:
+                user_id, user_name, user_usn = gallery.identity(user_index)
+                tracker.set_identity(track, gallery.version, user_id, user_name, user_usn, best_distance)
+                if hot_set is not None:
+                    hot_set.touch(user_id)
+
+    return [{
+        'box': tuple(int(v) for v in track.box),
+        'user_id': track.user_id,
+        'user_name': track.user_name,
+        'user_usn': track.user_usn,
+        'distance': track.distance,
+        'new_identity': track.user_id is not None and track.track_id in previous_ids and previous_ids[track.track_id] != track.user_id,
+        'quality': track.quality if track.track_id in checked else None,
+        'hot': hot_by_track.get(track.track_id),
+        'unknown_cached': unknown_by_track.get(track.track_id),
+        'encoded': track.track_id in encoded_ids,
+    } for track in tracks]
+
+
+def parse_roi(value):
+    """
+    Normalize an ROI from the API: {"x", "y", "width", "height"}, [x, y, width, height]
+    or a polygon [[x, y], ...] in frame pixels. Returns a list of (x, y) points or None.
+    Raises ValueError on malformed input.
+    """
+    if value is None or value == [] or value == {}:
+        return None
+    if isinstance(value, dict):
+        try:
+            x, y = float(value['x']), float(value['y'])
+            width, height = float(value['width']), float(value['height'])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError('roi rectangle needs numeric x, y, width and height')
+        value = [x, y, width, height]
+    if not isinstance(value, (list, tuple)):
+        raise ValueError('roi must be a rectangle or a list of [x, y] points')
+
+    if len(value) == 4 and all(isinstance(v, (int, float)) for v in value):
+        x, y, width, height = [float(v) for v in value]
+        if width <= 0 or height <= 0:
+            raise ValueError('roi width and height must be > 0')
+        return [(x, y), (x + width, y), (x + width, y + height), (x, y + height)]
+
+    try:
+        points = [(float(px), float(py)) for px, py in value]
+    except (TypeError, ValueError):
+        raise ValueError('roi polygon must be a list of [x, y] points')
+    if len(points) < 3:
+        raise ValueError('roi polygon needs at least 3 points')
+    return points
+
+
+class RegionOfInterest:
+    """Crops frames to the ROI's bounding box, masks polygon corners and downscales"""
+
+    def __init__(self, points=None, scale=DETECTION_SCALE):
+        self.points = points
+        self.scale = scale
+        self.frame_shape = None
+        self.bounds = None     # (x0, y0, x1, y1) crop in frame pixels
+        self.mask = None       # Polygon mask on the downscaled crop (None for rectangles)
+
+    def prepare_geometry(self, frame_shape):
+        """Compute the crop and mask once per frame size"""
+        self.frame_shape = frame_shape
+        height, width = frame_shape[:2]
+        self.bounds = (0, 0, width, height)
+        self.mask = None
+        if not self.points:
+            return
+        polygon = np.array(self.points, dtype=np.float32)
+        x0 = int(max(0, np.floor(polygon[:, 0].min())))
+        y0 = int(max(0, np.floor(polygon[:, 1].min())))
+        x1 = int(min(width, np.ceil(polygon[:, 0].max())))
+        y1 = int(min(height, np.ceil(polygon[:, 1].max())))
+        if x1 - x0 < 2 or y1 - y0 < 2:
+            print(f"⚠ Warning: ROI {self.points} is outside the {width}x{height} frame, using the full frame")
+            return
+        self.bounds = (x0, y0, x1, y1)
+
+        # Axis-aligned rectangles need no mask
+        xs, ys = set(polygon[:, 0]), set(polygon[:, 1])
+        if len(polygon) == 4 and len(xs) == 2 and len(ys) == 2:
+            return
+        small_w = max(1, int(round((x1 - x0) * self.scale)))
+        small_h = max(1, int(round((y1 - y0) * self.scale)))
+        mask = np.zeros((small_h, small_w), dtype=np.uint8)
+        shifted = (polygon - [x0, y0]) * self.scale
+        cv2.fillPoly(mask, [np.round(shifted).astype(np.int32)], 255)
+        self.mask = mask
+
+    def crop(self, frame):
+        """Downscaled ROI crop of the frame (what detection and the motion gate see)"""
+        if frame.shape != self.frame_shape:
+            self.prepare_geometry(frame.shape)
+        x0, y0, x1, y1 = self.bounds
+        small = cv2.resize(frame[y0:y1, x0:x1], (0, 0), fx=self.scale, fy=self.scale)
+        if self.mask is not None:
+            if self.mask.shape != small.shape[:2]:
+                self.mask = cv2.resize(self.mask, (small.shape[1], small.shape[0]), interpolation=cv2.INTER_NEAREST)
+            small = cv2.bitwise_and(small, small, mask=self.mask)
+        return small
+
+    def to_frame(self, box):
+        """Map a (top, right, bottom, left) box from the crop back to frame pixels"""
+        top, right, bottom, left = box
+        x0, y0 = self.bounds[0], self.bounds[1]
+        return (int(top / self.scale) + y0, int(right / self.scale) + x0,
+                int(bottom / self.scale) + y0, int(left / self.scale) + x0)
+
+    def pixel_ratio(self):
+        """Share of the full frame's pixels that go through detection"""
+        if self.frame_shape is None:
+            return 1.0
+        x0, y0, x1, y1 = self.bounds
+        return ((x1 - x0) * (y1 - y0) * self.scale ** 2) / float(self.frame_shape[0] * self.frame_shape[1])
+
+
+class MotionGate:
+    """Frame-differencing gate in front of detection/encoding"""
+
+    def __init__(self, sensitivity=MOTION_SENSITIVITY, keyframe_interval=MOTION_KEYFRAME_INTERVAL,
+                 pixel_threshold=MOTION_PIXEL_THRESHOLD, learning_rate=MOTION_LEARNING_RATE):
+        self.sensitivity = sensitivity
+        self.keyframe_interval = keyframe_interval
+        self.pixel_threshold = pixel_threshold
+        self.learning_rate = learning_rate
+        self.background = None
+        self.since_keyframe = 0
+        self.last_change = 0.0
+        # Metrics
+        self.frames_checked = 0
+        self.frames_skipped = 0
+
+    def check(self, small_frame, has_faces=False):
+        """
+        True if the detector should run on this (downscaled BGR) frame: there is motion,
+        faces are still being tracked, or a keyframe is due.
+        """
+        gray = cv2.cvtColor(small_frame, cv2.COLOR_BGR2GRAY)
+        gray = cv2.GaussianBlur(gray, (5, 5), 0)
+        self.frames_checked += 1
+        self.since_keyframe += 1
+
+        if self.background is None or self.background.shape != gray.shape:
+            self.background = gray.astype(np.float32)
+            self.since_keyframe = 0
+            return True
+
+        diff = cv2.absdiff(gray, cv2.convertScaleAbs(self.background))
+        self.last_change = np.count_nonzero(diff > self.pixel_threshold) / float(diff.size)
+        cv2.accumulateWeighted(gray, self.background, self.learning_rate)
+
+        if has_faces or self.last_change >= self.sensitivity or self.since_keyframe >= self.keyframe_interval:
+            self.since_keyframe = 0
+            return True
+        self.frames_skipped += 1
+        return False
+
+    def stats(self):
+        return {
+            'motion_frames_checked': self.frames_checked,
+            'motion_frames_skipped': self.frames_skipped,
+            'motion_last_change': round(float(self.last_change), 4),
+        }
+
+
+class RecognitionBudget:
+    """Recognition CPU budget shared fairly by every running camera"""
+
+    def __init__(self, cpu_budget=RECOGNITION_CPU_BUDGET):
+        self.cpu_budget = cpu_budget
+        self.cameras = set()
+        self.lock = threading.Lock()
+
+    def register(self, camera_id):
+        with self.lock:
+            self.cameras.add(camera_id)
+
+    def unregister(self, camera_id):
+        with self.lock:
+            self.cameras.discard(camera_id)
+
+    def share(self):
+        """Recognition seconds per second available to one camera"""
+        return self.cpu_budget / max(1, len(self.cameras))
+
+
+class FrameScheduler:
+    """Per-camera adaptive recognition cadence"""
+
+    def __init__(self, camera_id, budget, target_fps=RECOGNITION_TARGET_FPS, source_fps=SOURCE_FPS):
+        self.camera_id = camera_id
+        self.budget = budget
+        self.target_fps = target_fps
+        self.source_fps = source_fps
+        self.stage_seconds = {}     # EWMA latency per stage
+        self.last_processed = 0.0
+        # Metrics
+        self.frames_seen = 0
+        self.frames_processed = 0
+
+    def record(self, stage, seconds):
+        previous = self.stage_seconds.get(stage)
+        if previous is None:
+            self.stage_seconds[stage] = seconds
+        else:
+            self.stage_seconds[stage] = previous + LATENCY_EWMA_ALPHA * (seconds - previous)
+
+    def recognition_cost(self):
+        """Average seconds one recognition pass costs on this camera"""
+        return self.stage_seconds.get('recognize', 0.0)
+
+    def interval(self):
+        """Seconds between recognitions: target rate, slowed down to stay within our CPU share"""
+        return max(1.0 / self.target_fps, self.recognition_cost() / self.budget.share())
+
+    def should_process(self, now=None):
+        """True if this frame is due for recognition (the motion gate may still skip it)"""
+        now = time.time() if now is None else now
+        self.frames_seen += 1
+        if now - self.last_processed >= self.interval():
+            self.last_processed = now
+            return True
+        return False
+
+    def mark_processed(self):
+        """Count a frame that actually went through recognition"""
+        self.frames_processed += 1
+
+    def stats(self):
+        interval = self.interval()
+        return {
+            'target_fps': self.target_fps,
+            'recognition_interval_s': round(interval, 3),
+            'frames_skipped_between_recognitions': max(0, int(round(interval * self.source_fps)) - 1),
+            'stage_ms': {stage: round(seconds * 1000, 2) for stage, seconds in self.stage_seconds.items()},
+            'frames_seen': self.frames_seen,
+            'frames_processed': self.frames_processed,
+        }
+
+
+class FrameGrabber:
+    """Capture thread for one camera that only ever keeps the newest frame"""
+
+    def __init__(self, camera_url, width=640, height=480, reconnect_delay=CAPTURE_RECONNECT_DELAY):
+        self.camera_url = camera_url
+        self.width = width
+        self.height = height
+        self.reconnect_delay = reconnect_delay
+        self.cap = None
+        self.thread = None
+        self.running = False
+        self.cond = threading.Condition()
+        # Latest-frame slot, filled only when the processing loop is waiting for it
+        self.frame = None
+        self.frame_seq = 0
+        self.captured_at = 0.0
+        self.wanted = False
+        # Metrics
+        self.frames_captured = 0
+        self.frames_dropped = 0
+        self.frames_delivered = 0
+
+    def open(self):
+        cap = cv2.VideoCapture(self.camera_url)
+        if not cap.isOpened():
+            cap.release()
+            return False
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        # Keep the driver buffer short; the reader thread drains it anyway
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        self.cap = cap
+        return True
+
+    def start(self):
+        """Open the source and start the reader thread; False if the camera cannot be opened"""
+        if not self.open():
+            return False
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return True
+
+    def run(self):
+        while self.running:
+            if not self.cap.grab():
+                print(f"Warning: Could not read frame from {self.camera_url}")
+                time.sleep(self.reconnect_delay)
+                # Try to reopen camera
+                self.cap.release()
+                if not self.open():
+                    print(f"Error: Could not reopen {self.camera_url}")
+                    break
+                continue
+
+            grabbed_at = time.time()
+            with self.cond:
+                self.frames_captured += 1
+                if not self.wanted:
+                    # Nobody is waiting: skip the decode, the next grab will be newer anyway
+                    self.frames_dropped += 1
+                    continue
+
+            ret, frame = self.cap.retrieve()
+            if not ret:
+                continue
+            with self.cond:
+                self.frame = frame
+                self.frame_seq += 1
+                self.captured_at = grabbed_at
+                self.wanted = False
+                self.cond.notify_all()
+
+        self.cap.release()
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+
+    def read(self, timeout=CAPTURE_READ_TIMEOUT):
+        """
+        Wait for the next frame grabbed after this call.
+        Returns (frame, captured_at), or (None, None) on timeout or when the camera stopped.
+        """
+        with self.cond:
+            self.wanted = True
+            seq = self.frame_seq
+            self.cond.wait_for(lambda: self.frame_seq != seq or not self.running, timeout)
+            if self.frame_seq == seq:
+                return None, None
+            self.frames_delivered += 1
+            return self.frame, self.captured_at
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout=2.0)
+
+    def stats(self):
+        with self.cond:
+            return {
+                'frames_captured': self.frames_captured,
+                'frames_dropped': self.frames_dropped,
+                'frames_delivered': self.frames_delivered,
+            }
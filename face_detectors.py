@@ -0,0 +1,155 @@
+"""
+Face detector backends for the camera pipeline.
+
+Every detector has detect(rgb_frame) -> list of (top, right, bottom, left) boxes,
+the same format face_recognition.face_locations returns, so the tracker and the
+encoder do not care which backend found the face. All backends are CPU-only and
+use files that ship with the installed packages:
+
+- hog        dlib HOG via face_recognition (the original detector)
+- haar       OpenCV Haar cascade (haarcascade_frontalface_default.xml)
+- lbp        OpenCV LBP cascade (lbpcascade_frontalface_improved.xml); pip wheels
+             only bundle the Haar files, so this needs an OpenCV data directory
+             (system package or FACE_CASCADE_DIR)
+- two-stage  the Haar cascade proposes regions with a loose threshold and HOG
+             only confirms inside those regions
+
+Compare them on a recording with benchmark_face_detectors.py.
+"""
+
+import os
+
+import cv2
+import face_recognition
+import numpy as np
+
+DEFAULT_DETECTOR = 'hog'
+
+CASCADE_FILES = {
+    'haar': 'haarcascade_frontalface_default.xml',
+    'lbp': 'lbpcascade_frontalface_improved.xml',
+}
+# Places OpenCV installs its cascade files, searched in order after FACE_CASCADE_DIR
+CASCADE_DIRS = [
+    getattr(getattr(cv2, 'data', None), 'haarcascades', ''),
+    '/usr/share/opencv4/haarcascades',
+    '/usr/share/opencv4/lbpcascades',
+    '/usr/local/share/opencv4/haarcascades',
+    '/usr/local/share/opencv4/lbpcascades',
+    '/usr/share/opencv/haarcascades',
+    '/usr/share/opencv/lbpcascades',
+]
+
+# Cascade tuning for the downscaled frames the pipeline feeds in
+CASCADE_SCALE_FACTOR = 1.1
+CASCADE_MIN_NEIGHBORS = 5
+# Two-stage: looser cascade (recall matters, HOG rejects false positives),
+# and how much context around each proposal HOG gets, as a fraction of its size
+PROPOSAL_MIN_NEIGHBORS = 2
+PROPOSAL_MARGIN = 0.5
+
+
+def find_cascade(kind):
+    """Full path of the bundled cascade file for 'haar' or 'lbp'; ValueError if missing"""
+    filename = CASCADE_FILES[kind]
+    directories = [os.getenv('FACE_CASCADE_DIR', '')] + CASCADE_DIRS
+    for directory in directories:
+        if directory:
+            path = os.path.join(directory, filename)
+            if os.path.exists(path):
+                return path
+    raise ValueError(f"{kind} detector unavailable: {filename} not found (set FACE_CASCADE_DIR)")
+
+
+class HOGDetector:
+    """dlib HOG detector (face_recognition default)"""
+
+    name = 'hog'
+
+    def __init__(self, upsample=1):
+        self.upsample = upsample
+
+    def detect(self, rgb_frame):
+        return face_recognition.face_locations(rgb_frame, number_of_times_to_upsample=self.upsample, model='hog')
+
+
+class CascadeDetector:
+    """OpenCV Haar or LBP cascade on the greyscale frame"""
+
+    def __init__(self, kind='haar', min_neighbors=CASCADE_MIN_NEIGHBORS, scale_factor=CASCADE_SCALE_FACTOR):
+        self.name = kind
+        if not hasattr(cv2, 'CascadeClassifier'):
+            raise ValueError(f"{kind} detector unavailable: this OpenCV build has no CascadeClassifier")
+        self.classifier = cv2.CascadeClassifier(find_cascade(kind))
+        if self.classifier.empty():
+            raise ValueError(f"{kind} detector unavailable: could not load cascade")
+        self.min_neighbors = min_neighbors
+        self.scale_factor = scale_factor
+
+    def detect_rects(self, rgb_frame):
+        """Raw (x, y, w, h) detections"""
+        grey = cv2.cvtColor(rgb_frame, cv2.COLOR_RGB2GRAY)
+        grey = cv2.equalizeHist(grey)
+        rects = self.classifier.detectMultiScale(grey, scaleFactor=self.scale_factor, minNeighbors=self.min_neighbors)
+        return [tuple(int(v) for v in rect) for rect in rects]
+
+    def detect(self, rgb_frame):
+        return [(y, x + w, y + h, x) for x, y, w, h in self.detect_rects(rgb_frame)]
+
+
+class TwoStageDetector:
+    """Cascade proposals confirmed by HOG, so HOG only scans a fraction of the frame"""
+
+    name = 'two-stage'
+
+    def __init__(self, kind='haar', margin=PROPOSAL_MARGIN):
+        self.proposer = CascadeDetector(kind, min_neighbors=PROPOSAL_MIN_NEIGHBORS)
+        self.confirmer = HOGDetector()
+        self.margin = margin
+
+    def regions(self, rects, width, height):
+        """Proposals grown by the margin; overlapping regions are merged so no face is scanned twice"""
+        regions = []
+        for x, y, w, h in rects:
+            pad_x, pad_y = int(w * self.margin), int(h * self.margin)
+            regions.append([max(0, x - pad_x), max(0, y - pad_y), min(width, x + w + pad_x), min(height, y + h + pad_y)])
+
+        merged = True
+        while merged:
+            merged = False
+            for i in range(len(regions)):
+                for j in range(i + 1, len(regions)):
+                    a, b = regions[i], regions[j]
+                    if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                        regions[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                        del regions[j]
+                        merged = True
+                        break
+                if merged:
+                    break
+        return regions
+
+    def detect(self, rgb_frame):
+        height, width = rgb_frame.shape[:2]
+        boxes = []
+        for x0, y0, x1, y1 in self.regions(self.proposer.detect_rects(rgb_frame), width, height):
+            crop = np.ascontiguousarray(rgb_frame[y0:y1, x0:x1])  # dlib needs contiguous images
+            for top, right, bottom, left in self.confirmer.detect(crop):
+                boxes.append((top + y0, right + x0, bottom + y0, left + x0))
+        return boxes
+
+
+# Backends selectable per camera ('detector' in POST /api/cameras)
+DETECTOR_TYPES = {
+    'hog': HOGDetector,
+    'haar': lambda: CascadeDetector('haar'),
+    'lbp': lambda: CascadeDetector('lbp'),
+    'two-stage': TwoStageDetector,
+}
+
+
+def create_detector(name=DEFAULT_DETECTOR):
+    """Instantiate a backend by name; ValueError for unknown or unavailable backends"""
+    if name not in DETECTOR_TYPES:
+        raise ValueError(f"Unknown detector '{name}' (choose from {', '.join(DETECTOR_TYPES)})")
+    return DETECTOR_TYPES[name]()
@@ -0,0 +1,656 @@
+"""
+Face gallery matching for the attendance system.
+
+Holds every enrolled face encoding in one contiguous float32 matrix so a probe
+can be matched against the whole gallery in a single vectorized pass instead of
+calling face_recognition.compare_faces + face_distance over a Python list.
+
+Encodings are grouped by user (1-2 photos each) with an offsets array, and the
+per-photo distances are reduced to one distance per user with a segmented min
+(np.minimum.reduceat), so matching, thresholding and identity lookup all work on
+user rows.
+
+GalleryService keeps the live gallery as immutable, versioned snapshots: writers
+build a new FaceGallery (copy-on-write) for a single user add/remove/replace and
+swap it in atomically, so camera threads never see a half-built gallery and never
+wait for a full reload.
+
+HotSet keeps the users a door sees over and over (people currently inside plus
+recently recognized ones, LRU capacity + TTL). A frame is matched against that
+small set first and only faces without a confident hot match fall back to the
+full gallery scan.
+
+UnknownCache remembers recent faces that matched nobody (visitors, guards), so the
+same stranger standing near the door is labelled Unknown without another gallery
+scan until the entry expires or the gallery changes.
+
+Snapshots can be persisted as a versioned .npy matrix + JSON sidecar and reopened
+with np.load(mmap_mode='r'), so startup skips the table scan and several worker
+processes share one page-cache copy of the matrix.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from face_index import INDEX_TYPES
+
+# Same tolerance the camera loop has always used
+DEFAULT_TOLERANCE = 0.5
+ENCODING_DIM = 128
+
+# Gallery layouts
+MODE_MIN = 'min'            # Keep every photo, distance = closest photo of the user
+MODE_CENTROID = 'centroid'  # One averaged encoding per user (half the matrix for 2-photo users)
+
+# Rows re-ranked exactly per probe when an approximate index is in use
+DEFAULT_RERANK_K = 16
+# IVF partitions are trained for ~nlist^2 encodings; once the gallery is this many times
+# larger they are retrained instead of reused, so nlist keeps up with the gallery
+INDEX_RETRAIN_GROWTH = 4
+
+# Hot set defaults: recently seen users kept, how long they stay hot, and the
+# (stricter than tolerance) distance a hot match needs to skip the full scan
+DEFAULT_HOT_CAPACITY = 64
+DEFAULT_HOT_TTL = 30 * 60
+DEFAULT_HOT_CONFIDENT_DISTANCE = 0.4
+
+# Unknown cache defaults: entries kept, seconds they live, how close a probe must be
+# to a cached stranger, and how far from every user a face must be to get cached.
+# The min distance must be at least tolerance + radius: then (triangle inequality) a
+# probe answered from the cache is at least tolerance from every user, so a cache hit
+# can never hide a face that the gallery would have matched
+DEFAULT_UNKNOWN_CAPACITY = 128
+DEFAULT_UNKNOWN_TTL = 60
+DEFAULT_UNKNOWN_RADIUS = 0.3
+DEFAULT_UNKNOWN_MIN_GALLERY_DISTANCE = 0.8
+
+# On-disk snapshot layout
+SNAPSHOT_META = 'gallery.json'
+SNAPSHOT_FORMAT = 1
+
+
+def encodings_to_bytes(encodings):
+    """Raw float32 bytes for a list of 128-d encodings (stored in users.face_encoding_blob)"""
+    return np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_DIM).tobytes()
+
+
+def encodings_from_bytes(data):
+    """(n,128) float32 view over stored bytes - no parsing, no copy"""
+    if not data:
+        return np.zeros((0, ENCODING_DIM), dtype=np.float32)
+    return np.frombuffer(data, dtype=np.float32).reshape(-1, ENCODING_DIM)
+
+
+class FaceGallery:
+    """User-indexed gallery: contiguous (R,128) float32 matrix + per-user offsets"""
+
+    def __init__(self, users=None, mode=MODE_MIN):
+        """
+        users: iterable of (user_id, name, usn, encodings) where encodings is a list of
+        128-d vectors. Users without encodings are skipped.
+        """
+        counts = []
+        blocks = []
+        user_ids = []
+        names = []
+        usns = []
+
+        for user_id, name, usn, encodings in (users or []):
+            block = self.user_block(encodings, mode)
+            if block is None:
+                continue
+            user_ids.append(user_id)
+            names.append(name)
+            usns.append(usn)
+            counts.append(len(block))
+            blocks.append(block)
+
+        matrix = np.concatenate(blocks) if blocks else None
+        self.set_arrays(mode, user_ids, names, usns, counts, matrix)
+
+    @staticmethod
+    def user_block(encodings, mode):
+        """(rows,128) float32 block for one user, or None if the user has no encodings"""
+        if encodings is None or len(encodings) == 0:
+            return None
+        block = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_DIM)
+        if mode == MODE_CENTROID:
+            block = block.mean(axis=0, keepdims=True)
+        return block
+
+    @classmethod
+    def from_arrays(cls, mode, user_ids, names, usns, counts, matrix):
+        """Build a gallery directly from an already grouped matrix"""
+        gallery = cls.__new__(cls)
+        gallery.set_arrays(mode, user_ids, names, usns, counts, matrix)
+        return gallery
+
+    def set_arrays(self, mode, user_ids, names, usns, counts, matrix):
+        self.mode = mode
+        self.version = 0
+        self.user_ids = list(user_ids)
+        self.names = list(names)
+        self.usns = list(usns)
+        if matrix is None or len(matrix) == 0:
+            self.matrix = np.zeros((0, ENCODING_DIM), dtype=np.float32)
+        else:
+            self.matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        self.counts = np.asarray(counts, dtype=np.int64)
+        # Start row of each user's block in self.matrix
+        self.offsets = np.concatenate(([0], np.cumsum(self.counts)[:-1])).astype(np.int64) if len(self.counts) else np.zeros(0, dtype=np.int64)
+        # Row -> user index, used when a caller works on individual rows
+        self.row_users = np.repeat(np.arange(len(self.counts)), self.counts)
+        # ||g||^2 for every gallery row, reused for every probe
+        self.sq_norms = np.einsum('ij,ij->i', self.matrix, self.matrix)
+        self.user_index = {user_id: idx for idx, user_id in enumerate(self.user_ids)}
+        # Optional approximate index (see face_index.py); None = exact full scan
+        self.index = None
+        self.rerank_k = DEFAULT_RERANK_K
+
+    def without_user(self, user_id):
+        """Copy of this gallery with one user's rows removed"""
+        idx = self.user_index.get(user_id)
+        if idx is None:
+            return self
+        start = self.offsets[idx]
+        end = start + self.counts[idx]
+        matrix = np.concatenate((self.matrix[:start], self.matrix[end:]))
+        return FaceGallery.from_arrays(
+            self.mode,
+            self.user_ids[:idx] + self.user_ids[idx + 1:],
+            self.names[:idx] + self.names[idx + 1:],
+            self.usns[:idx] + self.usns[idx + 1:],
+            np.delete(self.counts, idx),
+            matrix
+        )
+
+    def with_user(self, user_id, name, usn, encodings):
+        """Copy of this gallery with one user added, or their encodings replaced"""
+        base = self.without_user(user_id)
+        block = self.user_block(encodings, self.mode)
+        if block is None:
+            return base
+        return FaceGallery.from_arrays(
+            self.mode,
+            base.user_ids + [user_id],
+            base.names + [name],
+            base.usns + [usn],
+            np.append(base.counts, len(block)),
+            np.concatenate((base.matrix, block))
+        )
+
+    def __len__(self):
+        """Number of users in the gallery"""
+        return len(self.user_ids)
+
+    @property
+    def num_encodings(self):
+        return self.matrix.shape[0]
+
+    def build_index(self, kind, rerank_k=DEFAULT_RERANK_K, **kwargs):
+        """Put an approximate index (e.g. 'ivf') in front of the exact scan"""
+        self.index = INDEX_TYPES[kind](self.matrix, self.sq_norms, **kwargs)
+        self.rerank_k = rerank_k
+        return self.index
+
+    def identity(self, user_index):
+        """(user_id, name, usn) for a user row"""
+        return self.user_ids[user_index], self.names[user_index], self.usns[user_index]
+
+    def row_distances(self, face_encodings):
+        """(M,R) Euclidean distances from M probes to every encoding row in one BLAS call"""
+        probes = np.asarray(face_encodings, dtype=np.float32).reshape(-1, ENCODING_DIM)
+        # ||g - p||^2 = ||g||^2 - 2 g.p + ||p||^2
+        probe_sq = np.einsum('ij,ij->i', probes, probes)
+        sq = probe_sq[:, None] - 2.0 * (probes @ self.matrix.T) + self.sq_norms[None, :]
+        np.maximum(sq, 0, out=sq)
+        return np.sqrt(sq)
+
+    def reduce_rows(self, row_dists):
+        """Segmented min over each user's rows: (M,R) -> (M,U)"""
+        if self.mode == MODE_CENTROID:
+            return row_dists
+        return np.minimum.reduceat(row_dists, self.offsets, axis=1)
+
+    def distance_matrix(self, face_encodings):
+        """(M,U) distance from each probe to each user"""
+        return self.reduce_rows(self.row_distances(face_encodings))
+
+    def subset_distances(self, face_encodings, user_indices):
+        """(M,K) distances from each probe to the listed users only"""
+        user_indices = np.asarray(user_indices, dtype=np.int64)
+        counts = self.counts[user_indices]
+        # Rows of the selected users, gathered block by block
+        starts = np.repeat(self.offsets[user_indices], counts)
+        within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        rows = starts + within
+        probes = np.asarray(face_encodings, dtype=np.float32).reshape(-1, ENCODING_DIM)
+        probe_sq = np.einsum('ij,ij->i', probes, probes)
+        sq = probe_sq[:, None] - 2.0 * (probes @ self.matrix[rows].T) + self.sq_norms[rows][None, :]
+        np.maximum(sq, 0, out=sq)
+        row_dists = np.sqrt(sq)
+        if self.mode == MODE_CENTROID:
+            return row_dists
+        return np.minimum.reduceat(row_dists, np.cumsum(counts) - counts, axis=1)
+
+    def distances(self, face_encoding):
+        """Distance from one probe to every user"""
+        return self.distance_matrix([face_encoding])[0]
+
+    def best_match(self, face_encoding, tolerance=DEFAULT_TOLERANCE):
+        """
+        Return (user_index, distance) of the closest user.
+        user_index is None when the gallery is empty or the best distance is not below tolerance.
+        """
+        if len(self) == 0:
+            return None, None
+        dists = self.distances(face_encoding)
+        best_index = int(np.argmin(dists))
+        best_distance = float(dists[best_index])
+        if best_distance < tolerance:
+            return best_index, best_distance
+        return None, best_distance
+
+    def match_batch(self, face_encodings, tolerance=DEFAULT_TOLERANCE):
+        """
+        Match every face in a frame at once.
+        Returns a list of (user_index, distance) per probe, like best_match, but a
+        user is never given to two faces: pairs are assigned greedily from the
+        smallest distance up, and a face whose best user was already taken falls
+        back to its next-best user under tolerance (or Unknown).
+        """
+        num_probes = len(face_encodings)
+        if num_probes == 0 or len(self) == 0:
+            return [(None, None)] * num_probes
+        if self.index is not None:
+            return self.match_indexed(face_encodings, tolerance)
+        return self.assign(self.distance_matrix(face_encodings), tolerance)
+
+    def match_indexed(self, face_encodings, tolerance=DEFAULT_TOLERANCE):
+        """match_batch through the approximate index: top-k rows per probe, exact distances"""
+        rows, row_dists = self.index.search(face_encodings, self.rerank_k)
+        results = [(None, float(d) if np.isfinite(d) else None) for d in row_dists[:, 0]]
+
+        probe_idx, col = np.nonzero((rows >= 0) & (row_dists < tolerance))
+        if len(probe_idx) == 0:
+            return results
+        user_idx = self.row_users[rows[probe_idx, col]]
+        return self.assign_pairs(results, probe_idx, user_idx, row_dists[probe_idx, col])
+
+    @classmethod
+    def assign(cls, dists, tolerance=DEFAULT_TOLERANCE):
+        """Greedy one-user-per-face assignment over an (M,U) distance matrix"""
+        results = [(None, float(d)) for d in dists.min(axis=1)]
+
+        # Candidate (face, user) pairs under tolerance
+        probe_idx, user_idx = np.nonzero(dists < tolerance)
+        if len(probe_idx) == 0:
+            return results
+        return cls.assign_pairs(results, probe_idx, user_idx, dists[probe_idx, user_idx])
+
+    @staticmethod
+    def assign_pairs(results, probe_idx, user_idx, pair_dists):
+        """Assign candidate (face, user) pairs closest first, never reusing a face or a user"""
+        order = np.argsort(pair_dists, kind='stable')
+        assigned_users = set()
+        for k in order:
+            i = int(probe_idx[k])
+            j = int(user_idx[k])
+            if results[i][0] is not None or j in assigned_users:
+                continue
+            results[i] = (j, float(pair_dists[k]))
+            assigned_users.add(j)
+        return results
+
+
+class HotSet:
+    """Recently seen users, matched before the full gallery (LRU capacity + TTL)"""
+
+    def __init__(self, capacity=DEFAULT_HOT_CAPACITY, ttl=DEFAULT_HOT_TTL,
+                 confident_distance=DEFAULT_HOT_CONFIDENT_DISTANCE):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.confident_distance = confident_distance
+        self.lock = threading.Lock()
+        self.recent = OrderedDict()   # user_id -> last seen, oldest first
+        self.pinned = frozenset()     # Always hot (e.g. users currently inside)
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def touch(self, user_id, now=None):
+        """Mark a user as just seen"""
+        now = time.time() if now is None else now
+        with self.lock:
+            self.recent[user_id] = now
+            self.recent.move_to_end(user_id)
+            while len(self.recent) > self.capacity:
+                self.recent.popitem(last=False)
+                self.evictions += 1
+
+    def set_pinned(self, user_ids):
+        self.pinned = frozenset(user_ids)
+
+    def user_ids(self, now=None):
+        """Current hot users; expired entries are dropped on the way"""
+        now = time.time() if now is None else now
+        with self.lock:
+            while self.recent:
+                user_id, seen = next(iter(self.recent.items()))
+                if now - seen <= self.ttl:
+                    break
+                del self.recent[user_id]
+                self.evictions += 1
+            return list(self.pinned.union(self.recent))
+
+    def match(self, gallery, face_encodings, tolerance=DEFAULT_TOLERANCE):
+        """
+        match_batch with an early exit: faces with a confident match among the hot users
+        skip the full scan. Returns (results, hot_hits) - the match_batch results and,
+        per face, whether the hot set answered it.
+        """
+        num_probes = len(face_encodings)
+        hot = [gallery.user_index[user_id] for user_id in self.user_ids() if user_id in gallery.user_index]
+        if num_probes == 0 or not hot:
+            return gallery.match_batch(face_encodings, tolerance), [False] * num_probes
+
+        hot_results = gallery.assign(gallery.subset_distances(face_encodings, hot), min(tolerance, self.confident_distance))
+        results = [None] * num_probes
+        hot_hits = [False] * num_probes
+        taken = set()
+        for i, (k, distance) in enumerate(hot_results):
+            if k is not None:
+                results[i] = (hot[k], distance)
+                hot_hits[i] = True
+                taken.add(hot[k])
+
+        missed = [i for i in range(num_probes) if not hot_hits[i]]
+        if missed:
+            full_results = gallery.match_batch([face_encodings[i] for i in missed], tolerance)
+            for i, (user_index, distance) in zip(missed, full_results):
+                if user_index in taken:
+                    user_index = None  # Already given to another face in this frame
+                results[i] = (user_index, distance)
+        return results, hot_hits
+
+    def record(self, hits, misses):
+        with self.lock:
+            self.hits += hits
+            self.misses += misses
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hot_users': len(self.pinned.union(self.recent)),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+                'evictions': self.evictions,
+            }
+
+
+class UnknownCache:
+    """Ring buffer of recent unknown embeddings with TTL, tied to one gallery version"""
+
+    def __init__(self, capacity=DEFAULT_UNKNOWN_CAPACITY, ttl=DEFAULT_UNKNOWN_TTL, radius=DEFAULT_UNKNOWN_RADIUS,
+                 min_gallery_distance=DEFAULT_UNKNOWN_MIN_GALLERY_DISTANCE, tolerance=DEFAULT_TOLERANCE):
+        if min_gallery_distance < tolerance + radius:
+            raise ValueError(f"Unknown cache min gallery distance ({min_gallery_distance}) must be at least "
+                             f"tolerance + radius ({tolerance} + {radius})")
+        self.capacity = capacity
+        self.ttl = ttl
+        self.radius = radius
+        self.min_gallery_distance = min_gallery_distance
+        self.lock = threading.Lock()
+        self.matrix = np.zeros((capacity, ENCODING_DIM), dtype=np.float32)
+        self.added = np.full(capacity, -np.inf)
+        self.next_slot = 0
+        self.gallery_version = None
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def sync(self, gallery_version):
+        """Drop everything when the gallery changed - a cached stranger may just have enrolled"""
+        if gallery_version != self.gallery_version:
+            if self.gallery_version is not None:
+                self.invalidations += 1
+            self.added[:] = -np.inf
+            self.gallery_version = gallery_version
+
+    def lookup(self, face_encodings, gallery_version, now=None):
+        """Per probe: True if it is within radius of a live cached unknown"""
+        num_probes = len(face_encodings)
+        if num_probes == 0 or self.capacity <= 0:
+            return [False] * num_probes
+        now = time.time() if now is None else now
+        with self.lock:
+            self.sync(gallery_version)
+            live = self.added >= now - self.ttl
+            if not live.any():
+                return [False] * num_probes
+            cached = self.matrix[live]
+        probes = np.asarray(face_encodings, dtype=np.float32).reshape(-1, ENCODING_DIM)
+        sq = (np.einsum('ij,ij->i', probes, probes)[:, None] - 2.0 * (probes @ cached.T)
+              + np.einsum('ij,ij->i', cached, cached)[None, :])
+        return [bool(hit) for hit in sq.min(axis=1) < self.radius ** 2]
+
+    def add(self, face_encoding, best_distance, gallery_version, now=None):
+        """Remember a face that matched nobody, if it was clearly nobody"""
+        if self.capacity <= 0 or (best_distance is not None and best_distance < self.min_gallery_distance):
+            return
+        now = time.time() if now is None else now
+        with self.lock:
+            self.sync(gallery_version)
+            self.matrix[self.next_slot] = face_encoding
+            self.added[self.next_slot] = now
+            self.next_slot = (self.next_slot + 1) % self.capacity
+
+    def record(self, hits, misses):
+        with self.lock:
+            self.hits += hits
+            self.misses += misses
+
+    def stats(self, now=None):
+        now = time.time() if now is None else now
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'cached': int((self.added >= now - self.ttl).sum()),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+                'invalidations': self.invalidations,
+            }
+
+
+class GalleryService:
+    """
+    Owns the live gallery. Readers grab `snapshot` (an immutable FaceGallery with a
+    `version`); writers build a new snapshot copy-on-write and swap it in under a lock.
+    """
+
+    def __init__(self, mode=MODE_MIN, index_kind='none', index_min_encodings=0, nprobe=None):
+        self.mode = mode
+        self.index_kind = index_kind          # 'none', 'ivf' or 'auto'
+        self.index_min_encodings = index_min_encodings
+        self.nprobe = nprobe
+        self.lock = threading.Lock()
+        self.snapshot = FaceGallery(mode=mode)
+
+    @property
+    def version(self):
+        return self.snapshot.version
+
+    def wants_index(self, gallery):
+        if self.index_kind == 'ivf':
+            return gallery.num_encodings > 0
+        return self.index_kind == 'auto' and gallery.num_encodings >= self.index_min_encodings
+
+    def publish(self, gallery, previous=None, centroids=None, labels=None):
+        """
+        Attach the index (reusing trained centroids when possible) and swap the snapshot in.
+        labels: partition of every row of `gallery` under previous's centroids, if known.
+        """
+        if self.wants_index(gallery):
+            kwargs = {'nprobe': self.nprobe} if self.nprobe else {}
+            if previous is not None and previous.index is not None:
+                # Incremental change: keep the trained partitions, only reassign rows
+                centroids = previous.index.centroids
+            if centroids is not None and gallery.num_encodings >= INDEX_RETRAIN_GROWTH * len(centroids) ** 2:
+                centroids = None  # Outgrown (e.g. trained on a small gallery): retrain
+            if centroids is not None:
+                kwargs['centroids'] = centroids
+                if previous is not None and previous.index is not None:
+                    kwargs['labels'] = labels
+            gallery.build_index('ivf', **kwargs)
+        base_version = previous.version if previous is not None else self.snapshot.version
+        # A gallery opened from disk keeps its persisted version
+        gallery.version = max(base_version + 1, gallery.version)
+        self.snapshot = gallery
+        return gallery
+
+    @staticmethod
+    def carried_labels(previous, gallery, user_id):
+        """
+        Partition labels for `gallery` = previous with user_id's block removed and any new
+        rows appended (with_user/without_user), so only the changed rows are assigned
+        """
+        if previous.index is None:
+            return None
+        labels = previous.index.labels
+        idx = previous.user_index.get(user_id)
+        if idx is not None:
+            start = previous.offsets[idx]
+            labels = np.concatenate((labels[:start], labels[start + previous.counts[idx]:]))
+        added = gallery.num_encodings - len(labels)
+        if added > 0:
+            labels = np.concatenate((labels, previous.index.assign(gallery.matrix[-added:])))
+        return labels
+
+    def load(self, users):
+        """Full rebuild from (user_id, name, usn, encodings) tuples"""
+        return self.load_gallery(FaceGallery(users, mode=self.mode))
+
+    def load_gallery(self, gallery, centroids=None):
+        """Publish a ready-made gallery (e.g. opened from a snapshot)"""
+        with self.lock:
+            return self.publish(gallery, None, centroids)
+
+    def upsert_user(self, user_id, name, usn, encodings):
+        """Add a user or replace their encodings"""
+        with self.lock:
+            current = self.snapshot
+            updated = current.with_user(user_id, name, usn, encodings)
+            if updated is current:
+                return current
+            return self.publish(updated, current, labels=self.carried_labels(current, updated, user_id))
+
+    def remove_user(self, user_id):
+        """Drop a user from the gallery (no-op if not present)"""
+        with self.lock:
+            current = self.snapshot
+            if user_id not in current.user_index:
+                return current
+            updated = current.without_user(user_id)
+            return self.publish(updated, current, labels=self.carried_labels(current, updated, user_id))
+
+
+# Snapshots are saved from request threads: one save at a time per process, and never
+# an older version over a newer one (directory -> newest version this process wrote)
+_snapshot_lock = threading.Lock()
+_saved_versions = {}
+
+
+def save_snapshot(gallery, directory, fingerprint):
+    """
+    Persist a gallery as <directory>/gallery_v<version>.npy + gallery.json.
+    The sidecar is swapped in with os.replace, so readers always see a complete
+    matrix/sidecar pair; older matrices are unlinked (open memmaps stay valid).
+    Returns False (and writes nothing) if a newer version was already saved.
+    """
+    with _snapshot_lock:
+        if _saved_versions.get(directory, -1) >= gallery.version:
+            return False
+        os.makedirs(directory, exist_ok=True)
+        tmp_suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+
+        matrix_file = f"gallery_v{gallery.version}.npy"
+        tmp_matrix = os.path.join(directory, matrix_file + tmp_suffix)
+        with open(tmp_matrix, 'wb') as f:
+            np.save(f, np.ascontiguousarray(gallery.matrix, dtype=np.float32))
+        os.replace(tmp_matrix, os.path.join(directory, matrix_file))
+
+        centroids_file = None
+        if gallery.index is not None:
+            centroids_file = f"centroids_v{gallery.version}.npy"
+            tmp_centroids = os.path.join(directory, centroids_file + tmp_suffix)
+            with open(tmp_centroids, 'wb') as f:
+                np.save(f, gallery.index.centroids)
+            os.replace(tmp_centroids, os.path.join(directory, centroids_file))
+
+        meta = {
+            'format': SNAPSHOT_FORMAT,
+            'version': gallery.version,
+            'mode': gallery.mode,
+            'fingerprint': fingerprint,
+            'matrix_file': matrix_file,
+            'centroids_file': centroids_file,
+            'user_ids': [int(user_id) for user_id in gallery.user_ids],
+            'names': gallery.names,
+            'usns': gallery.usns,
+            'counts': [int(c) for c in gallery.counts],
+        }
+        tmp_meta = os.path.join(directory, SNAPSHOT_META + tmp_suffix)
+        with open(tmp_meta, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_meta, os.path.join(directory, SNAPSHOT_META))
+        _saved_versions[directory] = gallery.version
+
+        # Remove matrices from older versions
+        for name in os.listdir(directory):
+            if name.endswith('.npy') and name not in (matrix_file, centroids_file):
+                try:
+                    os.remove(os.path.join(directory, name))
+                except OSError:
+                    pass
+        return True
+
+
+def load_snapshot(directory, fingerprint=None, mode=None):
+    """
+    Open a persisted gallery with the matrix memory-mapped read-only.
+    Returns (gallery, centroids) or (None, None) if there is no usable snapshot,
+    it was written with another gallery mode, or its fingerprint does not match
+    (i.e. the database changed since it was written).
+    """
+    meta_path = os.path.join(directory, SNAPSHOT_META)
+    if not os.path.exists(meta_path):
+        return None, None
+    with open(meta_path) as f:
+        meta = json.load(f)
+    if meta.get('format') != SNAPSHOT_FORMAT:
+        return None, None
+    if fingerprint is not None and meta.get('fingerprint') != fingerprint:
+        return None, None
+    if mode is not None and meta.get('mode') != mode:
+        return None, None
+
+    matrix = np.load(os.path.join(directory, meta['matrix_file']), mmap_mode='r')
+    if matrix.shape[0] != sum(meta['counts']):
+        return None, None
+    gallery = FaceGallery.from_arrays(meta['mode'], meta['user_ids'], meta['names'], meta['usns'], meta['counts'], matrix)
+    gallery.version = meta['version']
+
+    centroids = None
+    if meta.get('centroids_file'):
+        centroids = np.load(os.path.join(directory, meta['centroids_file']))
+    return gallery, centroids
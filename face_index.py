@@ -0,0 +1,137 @@
+"""
+Approximate nearest-neighbour index for large face galleries.
+
+IVF (inverted file) index in pure NumPy: gallery rows are partitioned with
+k-means and a probe only scans the rows of its `nprobe` closest partitions.
+`nprobe` is the recall/latency knob - more partitions scanned means higher
+recall and slower search. Candidates are re-ranked with exact float32
+distances, so the caller can keep applying the usual 0.5 tolerance.
+
+An index is any object with search(probes, k) -> (rows, distances), both (M,k),
+with rows padded by -1 and distances by inf when fewer than k candidates exist.
+"""
+
+import numpy as np
+
+DEFAULT_NPROBE = 8
+KMEANS_ITERATIONS = 10
+KMEANS_POINTS_PER_LIST = 64   # Training sample size per partition
+ASSIGN_CHUNK = 8192           # Rows assigned per matmul when building lists
+
+
+def _squared_distances(points, points_sq, centers):
+    """(P,C) squared Euclidean distances"""
+    centers_sq = np.einsum('ij,ij->i', centers, centers)
+    sq = points_sq[:, None] - 2.0 * (points @ centers.T) + centers_sq[None, :]
+    np.maximum(sq, 0, out=sq)
+    return sq
+
+
+def _nearest_center(points, centers):
+    """Index of the closest center for every point, computed in chunks"""
+    labels = np.empty(len(points), dtype=np.int64)
+    for start in range(0, len(points), ASSIGN_CHUNK):
+        chunk = points[start:start + ASSIGN_CHUNK]
+        chunk_sq = np.einsum('ij,ij->i', chunk, chunk)
+        labels[start:start + ASSIGN_CHUNK] = np.argmin(_squared_distances(chunk, chunk_sq, centers), axis=1)
+    return labels
+
+
+def train_kmeans(points, nlist, iterations=KMEANS_ITERATIONS, seed=0):
+    """Plain Lloyd's k-means on a sample of the points; returns (nlist,D) float32 centroids"""
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(points), nlist * KMEANS_POINTS_PER_LIST)
+    sample = points[rng.choice(len(points), sample_size, replace=False)]
+    centers = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+
+    for _ in range(iterations):
+        labels = _nearest_center(sample, centers)
+        counts = np.bincount(labels, minlength=nlist)
+        sums = np.zeros_like(centers)
+        np.add.at(sums, labels, sample)
+        filled = counts > 0
+        centers[filled] = sums[filled] / counts[filled, None]
+        # Re-seed empty partitions from random sample points
+        empty = np.nonzero(~filled)[0]
+        if len(empty):
+            centers[empty] = sample[rng.choice(len(sample), len(empty), replace=False)]
+    return centers.astype(np.float32)
+
+
+class IVFIndex:
+    """Inverted-file index over a (R,128) float32 matrix"""
+
+    def __init__(self, matrix, sq_norms, nlist=None, nprobe=DEFAULT_NPROBE, centroids=None, labels=None):
+        self.matrix = matrix
+        self.sq_norms = sq_norms
+        if centroids is None:
+            if nlist is None:
+                nlist = max(1, int(np.sqrt(len(matrix))))
+            nlist = max(1, min(nlist, len(matrix)))
+            centroids = train_kmeans(matrix, nlist) if len(matrix) else np.zeros((1, matrix.shape[1]), dtype=np.float32)
+        self.centroids = centroids
+        self.nlist = len(centroids)
+        self.nprobe = nprobe
+        self.build_lists(labels)
+
+    def assign(self, rows):
+        """Partition of each given row"""
+        return _nearest_center(rows, self.centroids) if len(rows) else np.zeros(0, dtype=np.int64)
+
+    def build_lists(self, labels=None):
+        """
+        Group the gallery rows by partition. labels (partition per row) can be carried over
+        from the previous index when the centroids are reused; otherwise every row is assigned.
+        """
+        if labels is None or len(labels) != len(self.matrix):
+            labels = self.assign(self.matrix)
+        self.labels = labels
+        # Rows sorted by partition, with per-partition offsets
+        self.list_rows = np.argsort(labels, kind='stable')
+        counts = np.bincount(labels, minlength=self.nlist)
+        self.list_offsets = np.concatenate(([0], np.cumsum(counts)))
+
+    def candidates(self, probe_lists):
+        """Gallery rows stored in the given partitions"""
+        offsets = self.list_offsets
+        return np.concatenate([self.list_rows[offsets[c]:offsets[c + 1]] for c in probe_lists])
+
+    def search(self, probes, k):
+        """Top-k rows per probe, with exact distances for the scanned candidates"""
+        probes = np.asarray(probes, dtype=np.float32)
+        num_probes = len(probes)
+        rows = np.full((num_probes, k), -1, dtype=np.int64)
+        dists = np.full((num_probes, k), np.inf, dtype=np.float32)
+        if num_probes == 0 or len(self.matrix) == 0:
+            return rows, dists
+
+        probe_sq = np.einsum('ij,ij->i', probes, probes)
+        nprobe = min(self.nprobe, self.nlist)
+        center_dists = _squared_distances(probes, probe_sq, self.centroids)
+        if nprobe < self.nlist:
+            probe_lists = np.argpartition(center_dists, nprobe - 1, axis=1)[:, :nprobe]
+        else:
+            probe_lists = np.tile(np.arange(self.nlist), (num_probes, 1))
+
+        for i in range(num_probes):
+            cand = self.candidates(probe_lists[i])
+            if len(cand) == 0:
+                continue
+            # Exact re-rank of the scanned candidates
+            sq = self.sq_norms[cand] - 2.0 * (self.matrix[cand] @ probes[i]) + probe_sq[i]
+            np.maximum(sq, 0, out=sq)
+            top = min(k, len(cand))
+            if top < len(cand):
+                best = np.argpartition(sq, top - 1)[:top]
+            else:
+                best = np.arange(len(cand))
+            best = best[np.argsort(sq[best])]
+            rows[i, :top] = cand[best]
+            dists[i, :top] = np.sqrt(sq[best])
+        return rows, dists
+
+
+# Index kinds selectable through FACE_INDEX
+INDEX_TYPES = {
+    'ivf': IVFIndex,
+}
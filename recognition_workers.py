@@ -0,0 +1,287 @@
+"""
+Process-pool face recognition for the attendance system.
+
+HOG detection, dlib encoding and gallery matching are CPU-bound and all compete
+inside one interpreter when they run in the camera threads. RecognitionPool moves
+them to separate worker processes:
+
+- each camera is pinned to one worker (least loaded), which owns that camera's
+  FaceTracker, so identities carry across frames exactly like in-thread
+- camera threads copy the downscaled RGB frame into one of the camera's
+  shared-memory slots and block on the result (locations, identities, distances);
+  a slot is only reused or freed once the worker has answered the task that
+  names it, so a frame given up on after a timeout is never overwritten while
+  the worker still reads it
+- workers open the gallery from the on-disk snapshot (memory-mapped, shared page
+  cache) and reopen it when the main process publishes a new version
+- back-pressure: a worker accepts at most `max_pending` frames; when it is full
+  the frame is skipped instead of queued, so results never lag behind
+
+Database work (attendance, USN lookups) stays in the main process.
+Workers are forked, so the pool is meant for Linux deployments.
+"""
+
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+# Frames a worker may have queued before new frames are skipped
+DEFAULT_MAX_PENDING = 2
+# How long a camera thread waits for its result before giving up on the frame
+DEFAULT_RESULT_TIMEOUT = 5.0
+# Shared-memory frame slots per camera: one can still be held by a timed-out task
+# while the next frame goes into the other
+FRAME_SLOTS = 2
+
+
+def _worker_main(worker_index, task_queue, result_queue, snapshot_dir, gallery_options, hot_options, unknown_options,
+                 tolerance):
+    """Worker process loop: recognize frames for the cameras pinned to this worker"""
+    # Imported here so the parent only pays for them in the worker
+    from camera_pipeline import FaceQualityGate, FaceTracker, recognize_tracks
+    from face_detectors import create_detector
+    from face_gallery import GalleryService, HotSet, SNAPSHOT_META, UnknownCache, load_snapshot
+
+    service = GalleryService(**gallery_options)
+    # Pinned to the main process's hot users with every frame, plus this worker's own matches
+    hot_set = HotSet(**hot_options) if hot_options is not None else None
+    unknown_cache = UnknownCache(**unknown_options) if unknown_options is not None else None
+    meta_path = os.path.join(snapshot_dir, SNAPSHOT_META)
+    snapshot_mtime = None
+    trackers = {}
+    detectors = {}
+    quality_gates = {}
+    slots = {}   # camera_id -> OrderedDict(shm name -> SharedMemory), most recent last
+
+    def refresh_gallery(wanted_version):
+        nonlocal snapshot_mtime
+        if service.snapshot.version == wanted_version or not os.path.exists(meta_path):
+            return
+        mtime = os.path.getmtime(meta_path)
+        if mtime == snapshot_mtime:
+            return  # Main process has not written the new version yet
+        snapshot_mtime = mtime
+        try:
+            gallery, centroids = load_snapshot(snapshot_dir, mode=gallery_options.get('mode'))
+        except Exception as e:
+            # Broken or half-written snapshot: keep serving the previous gallery until the next save
+            print(f"Recognition worker {worker_index}: could not open gallery snapshot ({e})")
+            return
+        if gallery is not None:
+            service.load_gallery(gallery, centroids)
+
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        kind = task[0]
+
+        if kind == 'configure':
+            _, camera_id, detector_name, quality_options = task
+            try:
+                detectors[camera_id] = create_detector(detector_name)
+            except ValueError as e:
+                print(f"Recognition worker {worker_index}: {e}, using HOG for camera {camera_id}")
+                detectors[camera_id] = create_detector()
+            quality_gates[camera_id] = FaceQualityGate(**quality_options) if quality_options is not None else None
+            continue
+
+        if kind == 'release':
+            _, camera_id = task
+            trackers.pop(camera_id, None)
+            detectors.pop(camera_id, None)
+            quality_gates.pop(camera_id, None)
+            for slot in slots.pop(camera_id, {}).values():
+                slot.close()
+            continue
+
+        _, task_id, camera_id, shm_name, shape, gallery_version, hot_user_ids = task
+        try:
+            camera_slots = slots.setdefault(camera_id, OrderedDict())
+            slot = camera_slots.get(shm_name)
+            if slot is None:
+                if len(camera_slots) >= FRAME_SLOTS:
+                    # The parent replaced one of this camera's slots: drop the stalest mapping
+                    camera_slots.popitem(last=False)[1].close()
+                slot = shared_memory.SharedMemory(name=shm_name)
+                camera_slots[shm_name] = slot
+            camera_slots.move_to_end(shm_name)
+            frame = np.ndarray(shape, dtype=np.uint8, buffer=slot.buf)
+
+            refresh_gallery(gallery_version)
+            tracker = trackers.setdefault(camera_id, FaceTracker())
+            if hot_set is not None and hot_user_ids is not None:
+                hot_set.set_pinned(hot_user_ids)
+            timings = {}
+            results = recognize_tracks(frame, tracker, service.snapshot, tolerance, timings,
+                                       detectors.get(camera_id), quality_gates.get(camera_id), hot_set, unknown_cache)
+            del frame
+            result_queue.put((task_id, camera_id, worker_index, results, timings, None))
+        except Exception as e:
+            result_queue.put((task_id, camera_id, worker_index, None, {}, f"worker {worker_index}: {e}"))
+
+
+class RecognitionPool:
+    """Pool of recognition worker processes with per-camera shared-memory frame slots"""
+
+    def __init__(self, num_workers, snapshot_dir, gallery_options, hot_options=None, unknown_options=None, tolerance=0.5,
+                 max_pending=DEFAULT_MAX_PENDING, result_timeout=DEFAULT_RESULT_TIMEOUT):
+        self.num_workers = num_workers
+        self.max_pending = max_pending
+        self.result_timeout = result_timeout
+        self.lock = threading.Lock()
+        ctx = mp.get_context('fork')
+        # Start the shared-memory tracker before forking so workers share it instead of
+        # each starting their own (which would unlink our slots when a worker exits)
+        resource_tracker.ensure_running()
+        self.result_queue = ctx.Queue()
+        self.task_queues = []
+        self.processes = []
+        self.pending = [0] * num_workers
+        for worker_index in range(num_workers):
+            task_queue = ctx.Queue()
+            process = ctx.Process(
+                target=_worker_main,
+                args=(worker_index, task_queue, self.result_queue, snapshot_dir, gallery_options, hot_options, unknown_options, tolerance),
+                daemon=True,
+                name=f"recognition-worker-{worker_index}"
+            )
+            process.start()
+            self.task_queues.append(task_queue)
+            self.processes.append(process)
+
+        # camera_id -> {'worker', 'slots', 'results'}; each slot is {'shm', 'task'}, where
+        # task is the id of the unanswered task reading it (None when free)
+        self.cameras = {}
+        self.next_task_id = 0
+        # Metrics
+        self.frames_submitted = 0
+        self.frames_rejected = 0
+        self.frames_timed_out = 0
+        self.frames_slot_busy = 0
+
+        self.router = threading.Thread(target=self._route_results, daemon=True)
+        self.router.start()
+
+    def _route_results(self):
+        """Hand results from the shared result queue to the waiting camera thread"""
+        while True:
+            task_id, camera_id, worker, results, timings, error = self.result_queue.get()
+            with self.lock:
+                self.pending[worker] = max(0, self.pending[worker] - 1)
+                camera = self.cameras.get(camera_id)
+                if camera is not None:
+                    # The worker is done with the frame: its slot can take the next one
+                    for slot in camera['slots']:
+                        if slot['task'] == task_id:
+                            slot['task'] = None
+            if camera is not None:
+                camera['results'].put((task_id, results, timings, error))
+
+    def register_camera(self, camera_id, detector_name='hog', quality_options=None):
+        """
+        Pin a camera to the least-loaded worker and set up its detector backend and
+        quality gate (FaceQualityGate keyword arguments, None for no gate) there
+        """
+        with self.lock:
+            loads = [0] * self.num_workers
+            for camera in self.cameras.values():
+                loads[camera['worker']] += 1
+            worker = loads.index(min(loads))
+            self.cameras[camera_id] = {'worker': worker, 'slots': [], 'results': queue.Queue()}
+        # Queued ahead of the camera's first frame
+        self.task_queues[worker].put(('configure', camera_id, detector_name, quality_options))
+        return worker
+
+    def unregister_camera(self, camera_id):
+        with self.lock:
+            camera = self.cameras.pop(camera_id, None)
+        if camera is None:
+            return
+        self.task_queues[camera['worker']].put(('release', camera_id))
+        # Workers keep their own mapping, so a frame still being read stays valid
+        for slot in camera['slots']:
+            slot['shm'].close()
+            slot['shm'].unlink()
+
+    def recognize(self, camera_id, rgb_frame, gallery_version, hot_user_ids=None):
+        """
+        Run recognition for one frame in this camera's worker, checking hot_user_ids
+        (the main process's hot set) before the full gallery.
+        Returns (results, timings), or None if the worker is saturated (frame skipped),
+        every frame slot of the camera is still held by an unanswered task, or the worker
+        did not answer in time.
+        """
+        frame = np.ascontiguousarray(rgb_frame, dtype=np.uint8)
+        with self.lock:
+            camera = self.cameras.get(camera_id)
+            if camera is None:
+                return None
+            worker = camera['worker']
+            # Back-pressure: skip the frame rather than queue it behind others
+            if self.pending[worker] >= self.max_pending:
+                self.frames_rejected += 1
+                return None
+            free = [slot for slot in camera['slots'] if slot['task'] is None]
+            if not free and len(camera['slots']) >= FRAME_SLOTS:
+                self.frames_slot_busy += 1
+                return None
+            self.pending[worker] += 1
+            self.next_task_id += 1
+            task_id = self.next_task_id
+            self.frames_submitted += 1
+            slot = next((slot for slot in free if slot['shm'].size >= frame.nbytes), None)
+            if slot is None:
+                if free:
+                    # Too small and not in use by any task: replace it (the worker reattaches by name)
+                    camera['slots'].remove(free[0])
+                    free[0]['shm'].close()
+                    free[0]['shm'].unlink()
+                slot = {'shm': shared_memory.SharedMemory(create=True, size=frame.nbytes), 'task': None}
+                camera['slots'].append(slot)
+            slot['task'] = task_id
+        np.ndarray(frame.shape, dtype=np.uint8, buffer=slot['shm'].buf)[...] = frame
+
+        self.task_queues[worker].put(('recognize', task_id, camera_id, slot['shm'].name, frame.shape, gallery_version,
+                                      hot_user_ids))
+
+        deadline = time.time() + self.result_timeout
+        while True:
+            remaining = deadline - time.time()
+            try:
+                result_id, results, timings, error = camera['results'].get(timeout=max(0.0, remaining))
+            except queue.Empty:
+                with self.lock:
+                    self.frames_timed_out += 1
+                return None
+            if result_id != task_id:
+                continue  # Late answer for a frame we already gave up on
+            if error:
+                print(f"Recognition error on camera {camera_id}: {error}")
+                return None
+            return results, timings
+
+    def stats(self):
+        with self.lock:
+            return {
+                'workers': self.num_workers,
+                'alive': sum(1 for p in self.processes if p.is_alive()),
+                'pending': list(self.pending),
+                'cameras': {camera_id: camera['worker'] for camera_id, camera in self.cameras.items()},
+                'frames_submitted': self.frames_submitted,
+                'frames_rejected': self.frames_rejected,
+                'frames_timed_out': self.frames_timed_out,
+                'frames_slot_busy': self.frames_slot_busy,
+            }
+
+    def shutdown(self):
+        for task_queue in self.task_queues:
+            task_queue.put(None)
+        for camera_id in list(self.cameras):
+            self.unregister_camera(camera_id)
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Batch recompute of slot attendance over a date range.
+
+Slot attendance is normally written one student at a time as they enter and
+exit, so editing a slot's times leaves every existing row for it stale. This
+rebuilds slot_attendance from the raw attendance intervals instead:
+
+- load the attendance intervals, approved students and class slots for a chunk
+  of dates with a few plain queries
+- expand the slot schedule per date (day_of_week as in the live path) and
+  compute every interval x slot overlap in one vectorized pandas/NumPy pass
+- delete and rewrite the chunk's slot_attendance rows in one transaction; a job
+  that replaces a large share of the table instead drops the secondary indexes,
+  reloads every chunk and rebuilds the indexes once, in a single transaction
+
+The rules match process_slot_attendance: an overlap of at least a minute is
+Present (Late if the student entered after the slot started), and when a
+student has several intervals in a slot the latest one wins. Ended slots with
+no overlap are Absent for anyone seen that day and for approved students
+enrolled (approved, or registered) on or before the date; slots without a
+day_of_week only mark absences on class days. An interval without an exit yet
+counts for nothing until the exit is recorded.
+
+The app runs it from POST /api/admin/slot-attendance/recompute and after a
+slot's times are edited. It also works from the command line against the
+database directly:
+
+Usage:
+    python3 slot_recompute.py --start 2026-01-05 --end 2026-05-29
+    python3 slot_recompute.py --start 2026-01-05 --slot 3 --slot 4 --db sqlite:///attendance.db
+"""
+
+import argparse
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine
+
+DAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+# Days an every-day slot (no day_of_week) is held, for Absent rows
+DEFAULT_CLASS_DAYS = DAY_NAMES[:5]
+# Dates rewritten per transaction (and per progress report)
+DEFAULT_CHUNK_DAYS = 7
+# A job replacing at least this share of slot_attendance rebuilds its indexes once
+# instead of updating them row by row
+BULK_REWRITE_FRACTION = 0.25
+# Connection settings for the job only, restored afterwards. synchronous=OFF skips the
+# fsyncs (an OS crash or power loss mid-job can damage the database, a process crash
+# cannot); the large page cache keeps the index pages being rewritten in memory
+JOB_PRAGMAS = {'synchronous': 'OFF', 'cache_size': -262144, 'temp_store': 'MEMORY'}
+
+# How SQLAlchemy's DateTime stores values in SQLite (rows are written without the ORM)
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+# Row key (user_id, slot_id, date), with the date as a day number: de-duplicating and
+# sorting on integers is much cheaper than on date strings
+INT_KEY = ['user_id', 'slot_id', 'day']
+COLUMNS = ['user_id', 'user_name', 'user_usn', 'slot_id', 'slot_name', 'date', 'status', 'entry_time', 'exit_time',
+           'overlap_minutes']
+
+
+def date_range(start_date, end_date):
+    """'YYYY-MM-DD' strings from start_date to end_date inclusive"""
+    start = datetime.strptime(start_date, '%Y-%m-%d')
+    end = datetime.strptime(end_date, '%Y-%m-%d')
+    return [(start + timedelta(days=i)).strftime('%Y-%m-%d') for i in range((end - start).days + 1)]
+
+
+def parse_slot_table(slots):
+    """class_slots rows as a DataFrame with start/end offsets from midnight; bad times are skipped"""
+    rows = []
+    for slot in slots:
+        try:
+            start_hour, start_min = [int(part) for part in slot['start_time'].split(':')[:2]]
+            end_hour, end_min = [int(part) for part in slot['end_time'].split(':')[:2]]
+        except (AttributeError, ValueError):
+            continue
+        rows.append({
+            'slot_id': slot['id'],
+            'slot_name': slot['class_name'],
+            'day_of_week': slot['day_of_week'],
+            'start_offset': pd.Timedelta(hours=start_hour, minutes=start_min),
+            'end_offset': pd.Timedelta(hours=end_hour, minutes=end_min)
+        })
+    return pd.DataFrame(rows, columns=['slot_id', 'slot_name', 'day_of_week', 'start_offset', 'end_offset'])
+
+
+def expand_slots(slot_table, dates):
+    """Every (date, slot) that takes place: slots without a day_of_week run every day"""
+    days = pd.DataFrame({'date': dates})
+    days['day_start'] = pd.to_datetime(days['date'])
+    days['weekday'] = [DAY_NAMES[day.weekday()] for day in days['day_start']]
+    days['day'] = (days['day_start'] - pd.Timestamp(0)).dt.days
+    slots = days.merge(slot_table, how='cross')
+    slots = slots[slots['day_of_week'].isna() | (slots['day_of_week'] == slots['weekday'])]
+    slots = slots.assign(slot_start=slots['day_start'] + slots['start_offset'],
+                         slot_end=slots['day_start'] + slots['end_offset'],
+                         scheduled=slots['day_of_week'].notna())
+    return slots[['date', 'day', 'weekday', 'scheduled', 'slot_id', 'slot_name', 'slot_start', 'slot_end']].reset_index(drop=True)
+
+
+def compute_slot_attendance(records, slots, students, now, class_days=DEFAULT_CLASS_DAYS):
+    """
+    Slot attendance rows (COLUMNS) for the given attendance intervals.
+    records: user_id, user_name, user_usn, date, entry_time, exit_time (NaT while inside)
+    slots: expand_slots() output
+    students: approved user_id, user_name, user_usn, enrolled ('YYYY-MM-DD' or None)
+    """
+    records = records.copy()
+    records['entry_time'] = pd.to_datetime(records['entry_time'], format='ISO8601')
+    records['exit_time'] = pd.to_datetime(records['exit_time'], format='ISO8601')
+    # Open intervals end where they start, as in the live path (slot-processed at entry time)
+    records['end_time'] = records['exit_time'].fillna(records['entry_time'])
+
+    # Every interval against every slot of its date
+    pairs = records.merge(slots, on='date')
+    overlap_start = np.maximum(pairs['entry_time'].values, pairs['slot_start'].values)
+    overlap_end = np.minimum(pairs['end_time'].values, pairs['slot_end'].values)
+    overlap_minutes = (overlap_end - overlap_start) / np.timedelta64(1, 's') / 60
+    attended = overlap_minutes >= 1
+    present = pairs.loc[attended, ['user_id', 'user_name', 'user_usn', 'slot_id', 'slot_name', 'date', 'day']].copy()
+    present['status'] = np.where(pairs['entry_time'].values[attended] > pairs['slot_start'].values[attended],
+                                 'Late', 'Present')
+    present['entry_time'] = overlap_start[attended]
+    present['exit_time'] = overlap_end[attended]
+    present['overlap_minutes'] = overlap_minutes[attended]
+    present['sort_time'] = pairs['entry_time'].values[attended]
+    # Several intervals in one slot: the latest wins, like the live upserts
+    present = present.sort_values('sort_time').drop_duplicates(INT_KEY, keep='last').drop(columns='sort_time')
+
+    # Absent: ended slots with no overlap (every-day slots only on class days), for students
+    # enrolled by that date and anyone seen that day
+    ended = slots[(slots['slot_end'] <= pd.Timestamp(now)) & (slots['scheduled'] | slots['weekday'].isin(class_days))]
+    ended = ended[['date', 'day', 'slot_id', 'slot_name']]
+    enrolled = students.merge(ended, how='cross')
+    enrolled = enrolled[enrolled['enrolled'].isna() | (enrolled['enrolled'] <= enrolled['date'])]
+    roster = pd.concat([
+        enrolled[['user_id', 'user_name', 'user_usn', 'date', 'day', 'slot_id', 'slot_name']],
+        records[['user_id', 'user_name', 'user_usn', 'date']].drop_duplicates(['user_id', 'date']).merge(ended, on='date')
+    ]).drop_duplicates(INT_KEY)
+    absent = roster.merge(present[INT_KEY], on=INT_KEY, how='left', indicator=True)
+    absent = absent[absent['_merge'] == 'left_only'].drop(columns='_merge')
+    absent = absent.assign(status='Absent', entry_time=pd.NaT, exit_time=pd.NaT, overlap_minutes=0.0)
+
+    # Key order: inserts then walk the unique index sequentially
+    result = pd.concat([present[COLUMNS + ['day']], absent[COLUMNS + ['day']]], ignore_index=True)
+    return result.sort_values(INT_KEY, ignore_index=True)[COLUMNS]
+
+
+def to_rows(frame, created_at):
+    """
+    DataFrame -> parameter tuples for executemany, built column by column: datetimes are
+    formatted the way SQLAlchemy stores them in SQLite, NaT becomes NULL
+    """
+    columns = []
+    for column in COLUMNS:
+        values = frame[column]
+        if column in ('entry_time', 'exit_time'):
+            # Slot boundaries repeat across students: format each distinct time once
+            codes, uniques = pd.factorize(pd.to_datetime(values))
+            text = np.append(uniques.strftime(DATETIME_FORMAT).to_numpy(dtype=object), None)
+            columns.append(text[codes].tolist())  # Code -1 (NaT) picks the trailing None
+        else:
+            columns.append(values.tolist())
+    columns.append([created_at.strftime(DATETIME_FORMAT)] * len(frame))
+    return list(zip(*columns))
+
+
+def load_chunk(conn, slot_table, students, chunk, now, class_days):
+    """Recomputed slot attendance rows for one chunk of dates"""
+    records = pd.DataFrame(
+        conn.exec_driver_sql(
+            "SELECT user_id, user_name, user_usn, date, entry_time, exit_time FROM attendance "
+            "WHERE date BETWEEN ? AND ?", (chunk[0], chunk[-1])
+        ).all(),
+        columns=['user_id', 'user_name', 'user_usn', 'date', 'entry_time', 'exit_time']
+    )
+    return compute_slot_attendance(records, expand_slots(slot_table, chunk), students, now, class_days)
+
+
+def recompute_slot_attendance(engine, start_date, end_date, slot_ids=None, chunk_days=DEFAULT_CHUNK_DAYS,
+                              progress=None, now=None, class_days=DEFAULT_CLASS_DAYS):
+    """
+    Rewrite slot_attendance for start_date..end_date (only slot_ids, if given) from the
+    attendance table. progress(dates_done, dates_total, rows_written) is called after each
+    chunk. Returns a summary dict.
+
+    Small jobs replace each chunk in its own transaction. A job that rewrites at least
+    BULK_REWRITE_FRACTION of the table runs as one transaction that drops the secondary
+    indexes, reloads the rows and rebuilds the indexes once; other writers wait for it.
+    """
+    started = time.time()
+    now = now or datetime.now()
+    if slot_ids is not None:
+        slot_ids = [int(slot_id) for slot_id in slot_ids]
+    slot_filter = f" AND slot_id IN ({', '.join(str(slot_id) for slot_id in slot_ids)})" if slot_ids is not None else ''
+    insert = f"INSERT INTO slot_attendance ({', '.join(COLUMNS)}, created_at) VALUES ({', '.join(['?'] * (len(COLUMNS) + 1))})"
+    dates = date_range(start_date, end_date)
+    counts = {'Present': 0, 'Late': 0, 'Absent': 0}
+    rows_written = 0
+
+    # Plain SQL on the DB-API cursor: per-row ORM or Core value processing would dominate the runtime
+    with engine.connect() as conn:
+        slot_table = parse_slot_table(conn.exec_driver_sql(
+            "SELECT id, class_name, start_time, end_time, day_of_week FROM class_slots"
+        ).mappings().all())
+        students = pd.DataFrame(
+            conn.exec_driver_sql(
+                "SELECT id, name, usn, date(COALESCE(approved_at, created_at)) FROM users WHERE status = 'approved'"
+            ).all(),
+            columns=['user_id', 'user_name', 'user_usn', 'enrolled']
+        )
+        if slot_ids is not None:
+            slot_table = slot_table[slot_table['slot_id'].isin(slot_ids)]
+        replaced = conn.exec_driver_sql(f"SELECT COUNT(*) FROM slot_attendance WHERE date BETWEEN ? AND ?{slot_filter}",
+                                        (start_date, end_date)).scalar()
+        bulk = replaced >= BULK_REWRITE_FRACTION * conn.exec_driver_sql("SELECT COUNT(*) FROM slot_attendance").scalar()
+        previous = {name: conn.exec_driver_sql(f"PRAGMA {name}").scalar() for name in JOB_PRAGMAS}
+        for name, value in JOB_PRAGMAS.items():
+            conn.exec_driver_sql(f"PRAGMA {name} = {value}")
+        conn.commit()
+
+        try:
+            if bulk:
+                transaction = conn.begin()
+                indexes = conn.exec_driver_sql(
+                    "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = 'slot_attendance' "
+                    "AND sql IS NOT NULL"
+                ).all()
+                for name, _ in indexes:
+                    conn.exec_driver_sql(f'DROP INDEX "{name}"')
+                conn.exec_driver_sql(f"DELETE FROM slot_attendance WHERE date BETWEEN ? AND ?{slot_filter}",
+                                     (start_date, end_date))
+
+            for chunk_start in range(0, len(dates), chunk_days):
+                chunk = dates[chunk_start:chunk_start + chunk_days]
+                if not bulk:
+                    transaction = conn.begin()
+                result = load_chunk(conn, slot_table, students, chunk, now, class_days)
+                if not bulk:
+                    conn.exec_driver_sql(f"DELETE FROM slot_attendance WHERE date BETWEEN ? AND ?{slot_filter}",
+                                         (chunk[0], chunk[-1]))
+                rows = to_rows(result, now)
+                if rows:
+                    conn.exec_driver_sql(insert, rows)
+                if not bulk:
+                    transaction.commit()
+
+                rows_written += len(rows)
+                for status, count in result['status'].value_counts().items():
+                    counts[status] = counts.get(status, 0) + int(count)
+                if progress is not None:
+                    progress(min(chunk_start + chunk_days, len(dates)), len(dates), rows_written)
+
+            if bulk:
+                for _, sql in indexes:
+                    conn.exec_driver_sql(sql)
+                transaction.commit()
+        finally:
+            if conn.in_transaction():
+                conn.rollback()
+            for name, value in previous.items():
+                conn.exec_driver_sql(f"PRAGMA {name} = {value}")
+            conn.commit()
+
+    return {
+        'start_date': start_date,
+        'end_date': end_date,
+        'slot_ids': list(slot_ids) if slot_ids is not None else None,
+        'dates': len(dates),
+        'rows': rows_written,
+        'present': counts['Present'],
+        'late': counts['Late'],
+        'absent': counts['Absent'],
+        'bulk': bulk,
+        'seconds': round(time.time() - started, 2)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Recompute slot attendance from raw attendance intervals')
+    parser.add_argument('--start', required=True, help='First date (YYYY-MM-DD)')
+    parser.add_argument('--end', default=datetime.now().strftime('%Y-%m-%d'), help='Last date (default: today)')
+    parser.add_argument('--slot', type=int, action='append', dest='slot_ids', help='Only this slot id (repeatable)')
+    parser.add_argument('--db', default='sqlite:///attendance.db', help='Database URL')
+    parser.add_argument('--chunk-days', type=int, default=DEFAULT_CHUNK_DAYS, help='Dates per transaction')
+    parser.add_argument('--class-days', default=','.join(DEFAULT_CLASS_DAYS),
+                        help='Days every-day slots are held, comma separated (default: Monday-Friday)')
+    args = parser.parse_args()
+
+    def report(done, total, rows):
+        print(f"  {done}/{total} dates, {rows} rows written")
+
+    class_days = [day.strip() for day in args.class_days.split(',') if day.strip()]
+    summary = recompute_slot_attendance(create_engine(args.db), args.start, args.end, args.slot_ids,
+                                        args.chunk_days, report, class_days=class_days)
+    print(f"✓ Recomputed {summary['rows']} slot attendance rows over {summary['dates']} dates in {summary['seconds']}s "
+          f"({summary['present']} present, {summary['late']} late, {summary['absent']} absent)")
+
+
+if __name__ == '__main__':
+    main()